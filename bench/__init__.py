@@ -0,0 +1 @@
+"""Офлайн-бенчмарки бота на локальных заглушках WhatsApp Web и Zoom."""
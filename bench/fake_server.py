@@ -0,0 +1,102 @@
+"""Локальный сервер с заглушками WhatsApp Web и Zoom API для бенчмарков."""
+
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+_PAGE = Path(__file__).resolve().parent / "fake_whatsapp.html"
+
+
+class _Server(ThreadingHTTPServer):
+    # стандартной очереди из 5 соединений не хватает параллельным клиентам:
+    # переполнение даёт секундные паузы на повторной отправке SYN
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeServer:
+    """HTTP‑сервер на случайном порту.
+
+    ``GET /`` и ``GET /send?phone=...`` отдают страницу-заглушку WhatsApp Web,
+    ``POST /oauth/token`` и ``POST /v2/users/me/meetings`` имитируют Zoom.
+    Параметры сценария (ответы, задержки, недействительные номера)
+    передаются странице через ``config``.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, zoom_latency: float = 0.0) -> None:
+        self.config = {
+            "answers": {},
+            "reply_delay_ms": 200,
+            "load_delay_ms": 500,
+            "invalid_prefixes": ["000"],
+        }
+        self.config.update(config or {})
+        self.zoom_latency = zoom_latency
+        self.counts = {"page": 0, "token": 0, "meeting": 0}
+        self._meeting_ids = itertools.count(1)
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def _page(self) -> bytes:
+        html = _PAGE.read_text(encoding="utf-8")
+        return html.replace("__FAKE_CONFIG__", json.dumps(self.config, ensure_ascii=False)).encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _reply(self, code: int, body: bytes, content_type: str) -> None:
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                server.counts["page"] += 1
+                self._reply(200, server._page(), "text/html; charset=utf-8")
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                time.sleep(server.zoom_latency)
+                if self.path.startswith("/oauth/token"):
+                    server.counts["token"] += 1
+                    data = {"access_token": "bench-token", "expires_in": 3600}
+                elif self.path.startswith("/v2/users/me/meetings"):
+                    server.counts["meeting"] += 1
+                    data = {"join_url": f"{server.url}/j/{next(server._meeting_ids)}"}
+                else:
+                    self._reply(404, b"{}", "application/json")
+                    return
+                self._reply(200, json.dumps(data).encode(), "application/json")
+
+        return Handler
+
+    def start(self) -> FakeServer:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> FakeServer:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,264 @@
+"""Офлайн-бенчмарки отправки, опроса и Zoom на локальных заглушках.
+
+Запуск::
+
+    python -m bench.run --scenario all --baseline bench_output.txt
+
+Каждый прогон дописывает строку JSON с хешем коммита в ``--output``, а при
+указании ``--baseline`` печатает изменение метрик относительно последнего
+результата того же сценария.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import click
+
+from .fake_server import FakeServer
+
+# Метрики, для которых меньшее значение лучше
+_LOWER_IS_BETTER = {"rss_mb_per_session", "elapsed_s"}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _rss_per_session(pool) -> Optional[float]:
+    sizes = [row.rss for row in pool.memory() if row.rss is not None]
+    return round(sum(sizes) / len(sizes) / 2 ** 20, 1) if sizes else None
+
+
+def _make_pool(sessions: int, headless: bool, lean: bool):
+    from src.rate_limit import AdaptiveRateLimiter
+    from src.session_pool import SessionPool, session_profiles
+    from src.whatsapp_sender import WhatsAppClient
+
+    def factory(**kwargs) -> WhatsAppClient:
+        return WhatsAppClient(headless=headless, lean=lean, **kwargs)
+
+    # темп не ограничивается: измеряется сам конвейер, а не политика отправки
+    limiter = AdaptiveRateLimiter(1000, min_rate=1000, max_rate=1000, burst=1000)
+    pool = SessionPool(sessions, factory=factory, profiles=session_profiles(sessions), limiter=limiter)
+    pool.warm()
+    return pool
+
+
+def bench_send(messages: int, chats: int, sessions: int, headless: bool, lean: bool) -> Dict[str, Any]:
+    """Отправить ``messages`` сообщений по ``chats`` чатам."""
+    from src.ingest import run_bounded
+
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    with _make_pool(sessions, headless, lean) as pool:
+
+        def send(i: int) -> None:
+            with pool.session() as client:
+                status = client.send_message(f"+7900{i % chats:07d}", f"bench message {i}")
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.monotonic()
+        run_bounded(range(messages), send, sessions)
+        elapsed = time.monotonic() - started
+        rss = _rss_per_session(pool)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "messages_per_s": round(messages / elapsed, 3),
+        "sent": statuses.get("sent", 0),
+        "rss_mb_per_session": rss,
+    }
+
+
+def _run_engine(transport, respondents: int, prefix: str) -> Dict[str, Any]:
+    from src.meeting_pool import get_meeting_pool
+    from src.survey_engine import SurveyEngine
+
+    # как и команда survey, пополнять запас встреч с самого начала
+    get_meeting_pool().start()
+
+    finished: List[bool] = []
+    engine = SurveyEngine(transport=transport, reply_timeout=30, on_finish=lambda conv, ok: finished.append(ok))
+    transport.subscribe(lambda m: engine.submit(m.phone, m.text))
+    for i in range(respondents):
+        engine.enqueue(f"{prefix}{i:07d}", f"Respondent {i}")
+    started = time.monotonic()
+    engine.run()
+    elapsed = time.monotonic() - started
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "surveys_per_hour": round(len(finished) / elapsed * 3600, 1),
+        "qualified": sum(finished),
+        "failed": len(engine.failed),
+    }
+
+
+def bench_survey(respondents: int, sessions: int, headless: bool, lean: bool) -> Dict[str, Any]:
+    """Провести ``respondents`` опросов через движок и наблюдатель чатов."""
+    from src.transport import SeleniumTransport
+
+    with _make_pool(sessions, headless, lean) as pool:
+        transport = SeleniumTransport(pool, interval=0.2)
+        try:
+            metrics = _run_engine(transport, respondents, "+7901")
+            metrics["rss_mb_per_session"] = _rss_per_session(pool)
+        finally:
+            transport.close()
+    return metrics
+
+
+def bench_memory(respondents: int, reply_delay: int, answers: Dict[str, str]) -> Dict[str, Any]:
+    """Провести ``respondents`` опросов с синтетическими респондентами в памяти."""
+    from src.transport import InMemoryTransport, scripted
+
+    with InMemoryTransport(scripted(answers), reply_delay=(0.0, reply_delay / 1000)) as transport:
+        return _run_engine(transport, respondents, "+7902")
+
+
+def bench_zoom(meetings: int, workers: int, server: FakeServer) -> Dict[str, Any]:
+    """Создать ``meetings`` встреч параллельно из ``workers`` потоков."""
+    from src.ingest import run_bounded
+    from src.zoom import ZoomClient
+
+    client = ZoomClient("bench", "bench", "bench")
+    started = time.monotonic()
+    run_bounded(range(meetings), lambda i: client.create_meeting({"topic": f"bench {i}", "type": 3}), workers)
+    elapsed = time.monotonic() - started
+    client.close()
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "meetings_per_s": round(meetings / elapsed, 1),
+        "token_requests": server.counts["token"],
+    }
+
+
+def _compare(result: Dict[str, Any], baseline: Path) -> None:
+    previous = None
+    for line in baseline.read_text(encoding="utf-8").splitlines():
+        entry = json.loads(line)
+        if entry["scenario"] == result["scenario"] and entry["params"] == result["params"]:
+            previous = entry
+    if previous is None:
+        click.echo(f"  no baseline for {result['scenario']}")
+        return
+    for key, value in result["metrics"].items():
+        old = previous["metrics"].get(key)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        change = (value - old) / old * 100
+        worse = change > 0 if key in _LOWER_IS_BETTER else change < 0
+        marker = " REGRESSION" if worse and abs(change) >= 10 else ""
+        click.echo(f"  {key}: {old} -> {value} ({change:+.1f}%){marker}")
+
+
+@click.command()
+@click.option(
+    "--scenario",
+    type=click.Choice(["send", "survey", "memory", "zoom", "all"]),
+    default="all",
+    show_default=True,
+)
+@click.option("--messages", default=50, show_default=True, help="Messages in the send scenario")
+@click.option("--chats", default=10, show_default=True, help="Distinct chats in the send scenario")
+@click.option("--respondents", default=20, show_default=True, help="Surveys in the survey scenario")
+@click.option("--synthetic", default=10000, show_default=True, help="Surveys in the memory scenario")
+@click.option("--meetings", default=100, show_default=True, help="Meetings in the zoom scenario")
+@click.option("--sessions", default=1, show_default=True, help="Chrome sessions")
+@click.option("--reply-delay", default=200, show_default=True, help="Scripted reply delay, ms")
+@click.option("--headless/--no-headless", default=True, show_default=True)
+@click.option("--lean/--no-lean", default=False, show_default=True, help="Launch Chrome in lean mode")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=Path("bench_output.txt"),
+    show_default=True,
+)
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False, path_type=Path), default=None)
+def main(
+    scenario: str,
+    messages: int,
+    chats: int,
+    respondents: int,
+    synthetic: int,
+    meetings: int,
+    sessions: int,
+    reply_delay: int,
+    headless: bool,
+    lean: bool,
+    output: Path,
+    baseline: Optional[Path],
+) -> None:
+    """Запустить офлайн-бенчмарки и записать результаты."""
+    workdir = tempfile.mkdtemp(prefix="whatsup-bench-")
+    os.environ["DATABASE_PATH"] = str(Path(workdir) / "bench.sqlite3")
+
+    from src.survey import QUESTIONS, REQUIRED_EDUCATION
+
+    answers = dict(zip(QUESTIONS, ["30", sorted(REQUIRED_EDUCATION)[0], "female"]))
+    server = FakeServer({"answers": answers, "reply_delay_ms": reply_delay}).start()
+    os.environ.update(
+        {
+            "WHATSAPP_URL": server.url,
+            "ZOOM_API_URL": f"{server.url}/v2",
+            "ZOOM_TOKEN_URL": f"{server.url}/oauth/token",
+            "ZOOM_CLIENT_ID": "bench",
+            "ZOOM_CLIENT_SECRET": "bench",
+            "ZOOM_ACCOUNT_ID": "bench",
+        }
+    )
+
+    scenarios: Dict[str, tuple[Dict[str, Any], Callable[[], Dict[str, Any]]]] = {
+        "send": (
+            {"messages": messages, "chats": chats, "sessions": sessions, "lean": lean},
+            lambda: bench_send(messages, chats, sessions, headless, lean),
+        ),
+        "survey": (
+            {"respondents": respondents, "sessions": sessions, "reply_delay": reply_delay, "lean": lean},
+            lambda: bench_survey(respondents, sessions, headless, lean),
+        ),
+        "memory": (
+            {"respondents": synthetic, "reply_delay": reply_delay},
+            lambda: bench_memory(synthetic, reply_delay, answers),
+        ),
+        "zoom": ({"meetings": meetings}, lambda: bench_zoom(meetings, 8, server)),
+    }
+    selected = list(scenarios) if scenario == "all" else [scenario]
+    commit = _commit()
+    try:
+        for name in selected:
+            params, run = scenarios[name]
+            click.echo(f"Running {name} {params}...")
+            result = {
+                "scenario": name,
+                "commit": commit,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "params": params,
+                "metrics": run(),
+            }
+            click.echo(f"  {json.dumps(result['metrics'])}")
+            if baseline:
+                _compare(result, baseline)
+            with open(output, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(result) + "\n")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Кампании рассылки и опроса с возобновлением после сбоя."""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from .database import get_connection, get_writer, migrate
+from .ingest import Contact
+
+# Состояния строки исходящей очереди по порядку
+QUEUED = "queued"
+SENT = "sent"
+REPLIED = "replied"
+FINISHED = "finished"
+
+_UPSERT_OUTBOX = (
+    "INSERT INTO outbox (campaign_id, phone, state, answers, updated_at) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (campaign_id, phone) DO UPDATE SET "
+    "state = excluded.state, answers = excluded.answers, updated_at = excluded.updated_at"
+)
+
+# Новый контакт; строку, которую успел продвинуть процесс аккаунта, не трогает
+_INSERT_QUEUED = (
+    "INSERT INTO outbox (campaign_id, phone, state, answers, updated_at) VALUES (?, ?, ?, '[]', ?) "
+    "ON CONFLICT (campaign_id, phone) DO NOTHING"
+)
+
+
+class Progress(NamedTuple):
+    """Сохранённое состояние контакта внутри кампании."""
+
+    state: str
+    answers: List[str]
+
+
+class Campaign:
+    """Кампания, отслеживающая каждый номер в таблице ``outbox``.
+
+    Переходы ``queued → sent → replied → finished`` записываются через общий
+    :class:`DatabaseWriter`. При ``resume`` уже завершённые номера
+    пропускаются, а незаконченные опросы продолжаются с последнего
+    отвеченного вопроса; без него кампания начинается заново.
+    """
+
+    def __init__(self, campaign_id: str, kind: str, source: str = "", *, resume: bool = False) -> None:
+        self.id = campaign_id
+        self.kind = kind
+        self.resume = resume
+        conn = get_connection()
+        try:
+            migrate(conn)
+            with conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO campaigns (id, kind, source, created_at) VALUES (?, ?, ?, ?)",
+                    (campaign_id, kind, source, datetime.utcnow().isoformat()),
+                )
+                if not resume:
+                    conn.execute("DELETE FROM outbox WHERE campaign_id = ?", (campaign_id,))
+        finally:
+            conn.close()
+
+    def pending(self, contacts: Iterable[Contact]) -> Iterator[Tuple[Contact, Progress]]:
+        """Отфильтровать завершённые контакты и вернуть остальные с прогрессом.
+
+        Новые контакты записываются в ``outbox`` в состоянии ``queued`` по
+        мере выдачи, поэтому воронка учитывает и тех, кому ещё не писали.
+        """
+        writer = get_writer()
+        writer.flush()
+        conn = get_connection()
+        try:
+            for contact in contacts:
+                row = conn.execute(
+                    "SELECT state, answers FROM outbox WHERE campaign_id = ? AND phone = ?",
+                    (self.id, contact.phone),
+                ).fetchone()
+                if row is None:
+                    writer.execute(_INSERT_QUEUED, (self.id, contact.phone, QUEUED, datetime.utcnow().isoformat()))
+                    yield contact, Progress(QUEUED, [])
+                elif row[0] != FINISHED:
+                    yield contact, Progress(row[0], json.loads(row[1]))
+        finally:
+            conn.close()
+
+    def mark(self, phone: str, state: str, answers: Optional[List[str]] = None) -> Future:
+        """Записать новое состояние номера; результат подтверждается после COMMIT."""
+        return get_writer().execute(
+            _UPSERT_OUTBOX,
+            (self.id, phone, state, json.dumps(answers or [], ensure_ascii=False), datetime.utcnow().isoformat()),
+        )
+
+    def counts(self) -> dict[str, int]:
+        """Вернуть число номеров кампании в каждом состоянии."""
+        get_writer().flush()
+        conn = get_connection()
+        try:
+            rows = conn.execute(
+                "SELECT state, COUNT(*) FROM outbox WHERE campaign_id = ? GROUP BY state",
+                (self.id,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
@@ -0,0 +1,105 @@
+"""Поиск ChromeDriver с кешем пути на диске."""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import config
+
+# Имена исполняемого файла Chrome в PATH
+_BROWSERS = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+_MAC_CHROME = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
+
+_lock = threading.Lock()
+_resolved: Optional[str] = None
+
+
+def _cache_path() -> Path:
+    default = Path.home() / ".cache" / "whatsup" / "chromedriver.json"
+    return Path(config.get("CHROMEDRIVER_CACHE") or default)
+
+
+def _version(binary: str) -> Optional[str]:
+    try:
+        output = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"\d+(?:\.\d+)+", output)
+    return match.group(0) if match else None
+
+
+def browser_version() -> Optional[str]:
+    """Вернуть версию установленного Chrome или ``None``, если её не определить."""
+    candidates = [config.get("CHROME_BINARY")] + [shutil.which(name) for name in _BROWSERS] + [_MAC_CHROME]
+    for binary in candidates:
+        if not binary or not os.path.exists(binary):
+            continue
+        version = _version(binary)
+        if version:
+            return version
+    return None
+
+
+def is_stale(path: str) -> bool:
+    """Проверить, что ChromeDriver ``path`` собран для другой основной версии Chrome.
+
+    Если какую-то из версий определить не удалось, драйвер устаревшим не
+    считается.
+    """
+    driver = _version(path)
+    browser = browser_version()
+    if not driver or not browser:
+        return False
+    return driver.split(".")[0] != browser.split(".")[0]
+
+
+def _load() -> Dict[str, str]:
+    try:
+        with open(_cache_path(), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(cache: Dict[str, str]) -> None:
+    path = _cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+        tmp.replace(path)
+    except OSError:
+        # без кеша драйвер просто будет найден заново при следующем запуске
+        pass
+
+
+def driver_path(refresh: bool = False) -> str:
+    """Вернуть путь к ChromeDriver для установленной версии Chrome.
+
+    Путь запоминается в процессе и в файле ``CHROMEDRIVER_CACHE`` с ключом
+    по версии браузера, поэтому ``ChromeDriverManager``, который проверяет
+    версии по сети, вызывается только при первом запуске и после
+    обновления Chrome. ``refresh`` принудительно находит драйвер заново.
+    """
+    global _resolved
+    with _lock:
+        if _resolved and not refresh and os.path.exists(_resolved):
+            return _resolved
+        version = browser_version() or "unknown"
+        cache = _load()
+        path = cache.get(version)
+        if refresh or not path or not os.path.exists(path):
+            from webdriver_manager.chrome import ChromeDriverManager
+
+            path = ChromeDriverManager().install()
+            cache[version] = path
+            _save(cache)
+        _resolved = path
+        return path
@@ -1,76 +1,327 @@
-import csv
+import sqlite3
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 import click
 
-from .database import get_connection, init_db
+from .campaign import FINISHED, Campaign, Progress
+from .database import (
+    BREAKDOWNS,
+    daily_totals,
+    get_connection,
+    init_db,
+    message_totals,
+    migrate,
+    survey_breakdown,
+    survey_funnel,
+)
 from threading import Semaphore, Thread
 
-from .whatsapp_sender import send_message
-from .survey import run_survey_whatsapp
+from .ingest import Contact, iter_contacts, run_bounded
+from .metrics import latency_summary, write_prometheus
+from .phones import PhoneRegistry
+
+# Selenium, requests и Zoom загружаются только командами, которые отправляют
+# сообщения, чтобы ``stats`` и ``update-db`` запускались быстро
+if TYPE_CHECKING:
+    from .transport import Transport
+
+# Ответы синтетических респондентов для --transport memory
+SYNTHETIC_ANSWERS = ["30", "высшее", "женский"]
 
 
 @click.group()
-def cli():
+@click.option(
+    "--transport",
+    type=click.Choice(["whatsapp", "memory"]),
+    default="whatsapp",
+    show_default=True,
+    help="Deliver messages via WhatsApp Web or simulated in-memory respondents",
+)
+@click.option(
+    "--reply-delay",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Maximum reply delay of simulated respondents, seconds",
+)
+@click.pass_context
+def cli(ctx: click.Context, transport: str, reply_delay: float):
     """Командная оболочка для бота WhatsUp."""
     pass
 
 
+def _memory_transport(reply_delay: float, _account: str = "") -> "Transport":
+    """Синтетические респонденты, отвечающие на вопросы опроса."""
+    from .survey import QUESTIONS
+    from .transport import InMemoryTransport, scripted
+
+    respondent = scripted(dict(zip(QUESTIONS, SYNTHETIC_ANSWERS)))
+    return InMemoryTransport(respondent, reply_delay=(0.0, reply_delay))
+
+
+def _use_transport() -> "Transport":
+    """Подключить транспорт, выбранный опциями группы, до конца команды."""
+    from .transport import close_transport, get_transport, set_transport
+
+    ctx = click.get_current_context()
+    params = ctx.find_root().params
+    if params["transport"] == "memory":
+        set_transport(_memory_transport(params["reply_delay"]))
+    transport = get_transport()
+
+    def close() -> None:
+        _report_recovery(transport)
+        _report_memory(transport)
+        close_transport()
+
+    ctx.call_on_close(close)
+    return transport
+
+
+def _report_recovery(transport: "Transport") -> None:
+    """Вывести, сколько операций пережили падение браузера."""
+    supervisor = getattr(transport, "supervisor", None)
+    if supervisor is None or not (supervisor.recovered or supervisor.breaker.trips):
+        return
+    click.echo(
+        f"Browser failures: {supervisor.recovered} operations retried successfully, "
+        f"dispatch paused {supervisor.breaker.trips}x"
+    )
+
+
+def _report_memory(transport: "Transport") -> None:
+    """Вывести память сессий браузера, чтобы оценить ёмкость хоста."""
+    pool = getattr(transport, "pool", None)
+    if pool is None:
+        return
+    rows = [row for row in pool.memory() if row.rss is not None or row.peak]
+    if not rows:
+        return
+    click.echo("Session memory:")
+    for row in rows:
+        current = f"{row.rss / 2 ** 20:.1f} MB" if row.rss is not None else "stopped"
+        click.echo(f"  session {row.index}: {current} (peak {row.peak / 2 ** 20:.1f} MB, recycled {row.recycles}x)")
+
+
+def _sharded_option(func):
+    return click.option(
+        "--sharded",
+        is_flag=True,
+        help="Spread contacts across the accounts in CHROME_PROFILES, one process per account",
+    )(func)
+
+
+def _run_sharded(kind: str, campaign: Campaign, pending: Iterable[tuple[Contact, Progress]], max_inflight: int) -> None:
+    """Провести кампанию через процессы аккаунтов из ``CHROME_PROFILES``."""
+    from functools import partial
+
+    from .sharding import ShardCoordinator, account_profiles, selenium_transport
+
+    accounts = account_profiles()
+    if not accounts:
+        raise click.UsageError("CHROME_PROFILES is not configured")
+    params = click.get_current_context().find_root().params
+    if params["transport"] == "memory":
+        make_transport = partial(_memory_transport, params["reply_delay"])
+    else:
+        make_transport = selenium_transport
+
+    def report(result) -> None:
+        status = result.detail if result.ok else f"failed: {result.detail}"
+        click.echo(f"{result.phone} via {result.account}: {status}")
+
+    coordinator = ShardCoordinator(
+        accounts,
+        make_transport,
+        kind=kind,
+        campaign=campaign,
+        max_inflight=max_inflight,
+        on_result=report,
+    )
+    done = coordinator.run(pending)
+    for account, count in done.items():
+        click.echo(f"{account}: {count} done")
+    for account in coordinator.unhealthy:
+        click.echo(f"{account}: marked unhealthy, contacts moved to other accounts")
+
+
+def _invalid_numbers_option(func):
+    return click.option(
+        "--invalid-numbers",
+        type=click.Choice(["skip", "last", "retry"]),
+        default="skip",
+        show_default=True,
+        help="What to do with numbers recently found not to be on WhatsApp: skip them, "
+        "try them after all others, or try them in order",
+    )(func)
+
+
+def _screen(pending: Iterable[tuple[Contact, Progress]], policy: str) -> Iterator[tuple[Contact, Progress]]:
+    """Пропустить или отложить номера, недавно оказавшиеся недействующими.
+
+    Каждый такой номер иначе стоит полного таймаута загрузки чата.
+    Отложенные при ``last`` контакты держатся в памяти до конца списка.
+    """
+    if policy == "retry":
+        yield from pending
+        return
+    registry = PhoneRegistry()
+    deferred: list[tuple[Contact, Progress]] = []
+    for item in pending:
+        if not registry.is_invalid(item[0].phone):
+            yield item
+        elif policy == "last":
+            deferred.append(item)
+        else:
+            click.echo(f"Skipping {item[0].phone}: not on WhatsApp")
+    yield from deferred
+
+
+def _campaign_options(func):
+    """Добавить команде опции ``--campaign`` и ``--resume``."""
+    func = click.option(
+        "--resume",
+        is_flag=True,
+        help="Skip contacts already finished in this campaign and continue open surveys",
+    )(func)
+    return click.option("--campaign", "campaign_id", default=None, help="Campaign name (default: CSV file name)")(func)
+
+
+def _open_campaign(kind: str, csv_file: Path, campaign_id: str | None, resume: bool) -> Campaign:
+    return Campaign(campaign_id or f"{kind}:{csv_file.name}", kind, str(csv_file.resolve()), resume=resume)
+
+
 @cli.command("send-messages")
 @click.argument("csv_file", type=click.Path(exists=True, path_type=Path))
-def send_messages_cmd(csv_file: Path) -> None:
+@click.option("--workers", default=1, show_default=True, help="Parallel senders")
+@_sharded_option
+@_invalid_numbers_option
+@_campaign_options
+def send_messages_cmd(
+    csv_file: Path,
+    workers: int,
+    sharded: bool,
+    invalid_numbers: str,
+    campaign_id: str | None,
+    resume: bool,
+) -> None:
     """Импортировать номера из CSV_FILE и отправить сообщения."""
-    with open(csv_file, newline="", encoding="utf-8") as fh:
+    campaign = _open_campaign("send", csv_file, campaign_id, resume)
+    pending = _screen(campaign.pending(iter_contacts(csv_file)), invalid_numbers)
+    if sharded:
+        _run_sharded("send", campaign, pending, max(workers, 10))
+        return
+    transport = _use_transport()
+
+    def send(item: tuple[Contact, Progress]) -> None:
+        contact, _ = item
+        text = contact.message or "Hello from WhatsUp bot!"
+        click.echo(f"Sending to {contact.phone}...")
         try:
-            reader = csv.DictReader(fh)
-            use_dict = "phone" in (reader.fieldnames or [])
-        except csv.Error:
-            fh.seek(0)
-            use_dict = False
-            reader = csv.reader(fh)
-        for row in reader:
-            phone = row["phone"] if use_dict else row[0]
-            message = row.get("message") if use_dict else None
-            text = message or "Hello from WhatsUp bot!"
-            click.echo(f"Sending to {phone}...")
-            try:
-                send_message(phone, text)
-            except Exception as exc:
-                click.echo(f"Error sending to {phone}: {exc}")
+            transport.send(contact.phone, text)
+        except Exception as exc:
+            click.echo(f"Error sending to {contact.phone}: {exc}")
+            return
+        campaign.mark(contact.phone, FINISHED)
+
+    run_bounded(pending, send, workers)
 
 
 @cli.command("survey")
 @click.argument("csv_file", type=click.Path(exists=True, path_type=Path))
 @click.option("--workers", default=1, show_default=True, help="Parallel surveys")
-def run_survey_cmd(csv_file: Path, workers: int) -> None:
+@click.option(
+    "--multiplex",
+    is_flag=True,
+    help="Run all surveys as one event-driven engine fed by the unread-chat watcher",
+)
+@click.option(
+    "--max-open",
+    default=500,
+    show_default=True,
+    help="Open conversations at once in --multiplex mode (per account with --sharded)",
+)
+@_sharded_option
+@_invalid_numbers_option
+@_campaign_options
+def run_survey_cmd(
+    csv_file: Path,
+    workers: int,
+    multiplex: bool,
+    max_open: int,
+    sharded: bool,
+    invalid_numbers: str,
+    campaign_id: str | None,
+    resume: bool,
+) -> None:
     """Запустить интерактивный опрос для номеров из CSV_FILE."""
+    from .meeting_pool import get_meeting_pool
+    from .survey import run_survey
+
+    campaign = _open_campaign("survey", csv_file, campaign_id, resume)
+    # запас встреч пополняет только этот процесс (при --sharded процессы
+    # аккаунтов его лишь расходуют), начиная до первого прошедшего отбор
+    get_meeting_pool().start()
+    pending = _screen(campaign.pending(iter_contacts(csv_file)), invalid_numbers)
+    if sharded:
+        _run_sharded("survey", campaign, pending, max_open)
+        return
+    transport = _use_transport()
+    if multiplex:
+        _run_survey_multiplexed(pending, campaign, max_open, transport)
+        return
 
-    with open(csv_file, newline="", encoding="utf-8") as fh:
+    def worker(item: tuple[Contact, Progress]) -> None:
+        contact, progress = item
+        click.echo(f"\nStarting survey for {contact.phone}")
         try:
-            reader = csv.DictReader(fh)
-            use_dict = "phone" in (reader.fieldnames or [])
-        except csv.Error:
-            fh.seek(0)
-            use_dict = False
-            reader = csv.reader(fh)
-        phones = [row["phone"] if use_dict else row[0] for row in reader]
+            run_survey(contact.phone, contact.phone, transport=transport, answers=progress.answers, campaign=campaign)
+        except Exception as exc:
+            click.echo(f"Survey for {contact.phone} failed: {exc}")
+            return
+        click.echo(f"Finished survey for {contact.phone}")
+
+    run_bounded(pending, worker, workers)
 
-    sem = Semaphore(workers)
-    threads: list[Thread] = []
 
-    def worker(number: str) -> None:
-        with sem:
-            click.echo(f"\nStarting survey for {number}")
-            run_survey_whatsapp(number, number)
-            click.echo(f"Finished survey for {number}")
+def _run_survey_multiplexed(
+    pending: Iterable[tuple[Contact, Progress]],
+    campaign: Campaign,
+    max_open: int,
+    transport: "Transport",
+) -> None:
+    """Провести все опросы через один планировщик и подписку на ответы.
 
-    for num in phones:
-        thread = Thread(target=worker, args=(num,), daemon=True)
-        threads.append(thread)
-        thread.start()
+    Новые диалоги открываются по мере завершения старых, так что в работе
+    одновременно не больше ``max_open`` опросов.
+    """
+    from .survey_engine import Conversation, SurveyEngine
 
-    for t in threads:
-        t.join()
+    slots = Semaphore(max_open)
+
+    def finished(conv: Conversation, qualified: bool) -> None:
+        click.echo(f"Finished survey for {conv.phone} (qualified: {qualified})")
+        slots.release()
+
+    engine = SurveyEngine(transport=transport, on_finish=finished, campaign=campaign)
+
+    def produce() -> None:
+        try:
+            for contact, progress in pending:
+                slots.acquire()
+                click.echo(f"Starting survey for {contact.phone}")
+                engine.enqueue(contact.phone, contact.phone, progress.answers)
+        finally:
+            # дождаться завершения всех открытых опросов
+            for _ in range(max_open):
+                slots.acquire()
+            engine.stop()
+
+    transport.subscribe(lambda m: engine.submit(m.phone, m.text))
+    Thread(target=produce, daemon=True).start()
+    engine.run(until_idle=False)
 
 
 @cli.command("update-db")
@@ -82,17 +333,89 @@ def update_db_cmd() -> None:
 
 
 @cli.command()
-def stats() -> None:
+@click.option("--days", type=int, default=None, help="Break down the last N days by day and status")
+@click.option("--latency", is_flag=True, help="Show p50/p95/p99 latency per pipeline stage")
+@click.option(
+    "--prometheus",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also write latency histograms to this file in Prometheus text format",
+)
+def stats(days: int | None, latency: bool, prometheus: Path | None) -> None:
     """Показать статистику отправленных сообщений и ответов на опрос."""
     conn = get_connection()
+    migrate(conn)
+    if latency or prometheus:
+        _show_latency(conn, latency, prometheus)
+        conn.close()
+        return
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat() if days else None
+    totals = message_totals(conn, since)
     cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM messages")
-    sent = cur.fetchone()[0]
     cur.execute("SELECT COUNT(*) FROM users WHERE answers IS NOT NULL")
     replies = cur.fetchone()[0]
+    daily = daily_totals(conn, since) if since else []
     conn.close()
-    click.echo(f"Messages sent: {sent}")
+    click.echo(f"Messages sent: {sum(count for _, count in totals)}")
+    for status, count in totals:
+        click.echo(f"  {status or 'unknown'}: {count}")
     click.echo(f"Replies received: {replies}")
+    if daily:
+        click.echo(f"By day since {since}:")
+        for day, status, count in daily:
+            click.echo(f"  {day} {status or 'unknown'}: {count}")
+
+
+@cli.command()
+@click.option("--campaign", "campaign_id", default=None, help="Only this survey campaign")
+@click.option("--days", type=int, default=None, help="Only the last N days")
+@click.option(
+    "--by",
+    "breakdowns",
+    type=click.Choice(sorted(BREAKDOWNS)),
+    multiple=True,
+    help="Break qualification down by this field (repeatable; default: age, education, gender)",
+)
+def report(campaign_id: str | None, days: int | None, breakdowns: tuple[str, ...]) -> None:
+    """Показать воронку отбора и разбивки по ответам опроса."""
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat() if days else None
+    conn = get_connection()
+    migrate(conn)
+    try:
+        funnel = survey_funnel(conn, campaign_id, since)
+        tables = [(by, survey_breakdown(conn, by, campaign_id, since)) for by in breakdowns or ("age", "education", "gender")]
+    finally:
+        conn.close()
+    top = funnel[0][1]
+    click.echo("Survey funnel:")
+    for stage, count in funnel:
+        share = f"{count / top:>8.1%}" if top else ""
+        click.echo(f"  {stage:<12}{count:>8}{share}")
+    for by, rows in tables:
+        click.echo(f"\nBy {by}:")
+        click.echo(f"  {'value':<20}{'responses':>10}{'completed':>10}{'qualified':>10}{'rate':>8}")
+        for value, responses, completed, qualified in rows:
+            click.echo(
+                f"  {str(value if value is not None else 'unknown'):<20}"
+                f"{responses:>10}{completed:>10}{qualified:>10}{qualified / responses:>8.1%}"
+            )
+
+
+def _show_latency(conn: sqlite3.Connection, show: bool, prometheus: Path | None) -> None:
+    if prometheus:
+        write_prometheus(conn, prometheus)
+        click.echo(f"Latency histograms written to {prometheus}")
+    if not show:
+        return
+    rows = latency_summary(conn)
+    if not rows:
+        click.echo("No latency data recorded yet")
+        return
+    click.echo(f"{'stage':<14}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for row in rows:
+        click.echo(
+            f"{row.stage:<14}{row.count:>8}{row.mean:>10.3f}{row.p50:>10.3f}{row.p95:>10.3f}{row.p99:>10.3f}"
+        )
 
 
 if __name__ == "__main__":
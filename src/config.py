@@ -37,3 +37,13 @@ def get(key: str, default: str | None = None) -> str | None:
             return _FILE_CONFIG[variant]
 
     return default
+
+
+def get_list(key: str) -> list[str]:
+    """Вернуть список строк: из ``config.json`` — списком, из окружения — через запятую."""
+    value = get(key)
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(item).strip() for item in value if str(item).strip()]
@@ -0,0 +1,79 @@
+"""Курсоры входящих сообщений: последнее обработанное сообщение в каждом чате."""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict, Optional
+
+from .database import get_connection, get_writer, migrate
+
+_UPSERT_CURSOR = (
+    "INSERT INTO chat_cursors (account, phone, message_id, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (account, phone) DO UPDATE SET "
+    "message_id = excluded.message_id, updated_at = excluded.updated_at"
+)
+
+
+# Курсор чата, в котором к моменту первого обращения не было входящих:
+# новыми считаются все входящие сообщения
+EMPTY_CHAT = "empty"
+
+
+class ChatCursors:
+    """``data-id`` последнего обработанного входящего сообщения по номерам.
+
+    Курсоры одного аккаунта (профиля Chrome) загружаются из таблицы
+    ``chat_cursors`` одним запросом при первом обращении, а продвигаются в
+    памяти и записываются через общий :class:`DatabaseWriter`. После
+    перезапуска чтение продолжается с того же сообщения: уже обработанные
+    ответы не повторяются, а пришедшие во время простоя не теряются.
+    """
+
+    def __init__(self, account: str = "") -> None:
+        self.account = account
+        self._cursors: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        if self._cursors is None:
+            get_writer().flush()
+            conn = get_connection()
+            try:
+                migrate(conn)
+                rows = conn.execute(
+                    "SELECT phone, message_id FROM chat_cursors WHERE account = ?", (self.account,)
+                ).fetchall()
+            finally:
+                conn.close()
+            self._cursors = dict(rows)
+        return self._cursors
+
+    def get(self, phone: str) -> Optional[str]:
+        """Вернуть курсор номера или ``None``, если чат ещё не читался."""
+        with self._lock:
+            return self._load().get(phone)
+
+    def advance(self, phone: str, message_id: str) -> Optional[Future]:
+        """Передвинуть курсор номера; запись подтверждается после COMMIT."""
+        with self._lock:
+            cursors = self._load()
+            if not message_id or cursors.get(phone) == message_id:
+                return None
+            cursors[phone] = message_id
+        return get_writer().execute(
+            _UPSERT_CURSOR, (self.account, phone, message_id, datetime.utcnow().isoformat())
+        )
+
+
+_CURSORS: Dict[str, ChatCursors] = {}
+_CURSORS_LOCK = threading.Lock()
+
+
+def get_cursors(account: str = "") -> ChatCursors:
+    """Вернуть общие курсоры аккаунта; сессии одного профиля делят их."""
+    with _CURSORS_LOCK:
+        if account not in _CURSORS:
+            _CURSORS[account] = ChatCursors(account)
+        return _CURSORS[account]
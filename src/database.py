@@ -1,8 +1,24 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 from pathlib import Path
+from typing import List, Optional, Tuple
 
-DB_PATH = Path(__file__).resolve().parent.parent / "database.sqlite3"
+from . import config
+
+DB_PATH = Path(config.get("DATABASE_PATH") or Path(__file__).resolve().parent.parent / "database.sqlite3")
+
+# Сколько раз повторять пакет, если база занята другим процессом, и
+# начальная пауза между попытками в секундах
+_BUSY_RETRIES = 3
+_BUSY_BACKOFF = 0.5
+
+logger = logging.getLogger(__name__)
 
 
 def get_connection(path: Path = DB_PATH) -> sqlite3.Connection:
@@ -10,8 +26,180 @@ def get_connection(path: Path = DB_PATH) -> sqlite3.Connection:
     return sqlite3.connect(path)
 
 
-def init_db(conn: sqlite3.Connection) -> None:
-    """Создать таблицы при отсутствии и добавить примеры данных."""
+# Миграции схемы по порядку; номер последней применённой хранится в
+# ``PRAGMA user_version``. Новые шаги добавляются только в конец списка и
+# должны быть идемпотентными: два процесса могут начать одну миграцию.
+_MIGRATIONS: List[str] = [
+    # 1: индексы журнала сообщений и счётчики по дням и статусам
+    """
+    CREATE INDEX IF NOT EXISTS idx_messages_user_phone ON messages(user_phone);
+    CREATE INDEX IF NOT EXISTS idx_messages_status ON messages(status);
+    CREATE INDEX IF NOT EXISTS idx_messages_sent_at ON messages(sent_at);
+    CREATE INDEX IF NOT EXISTS idx_users_answered ON users(phone) WHERE answers IS NOT NULL;
+
+    CREATE TABLE IF NOT EXISTS message_counters (
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, status)
+    ) WITHOUT ROWID;
+
+    INSERT OR IGNORE INTO message_counters (day, status, count)
+        SELECT substr(sent_at, 1, 10), COALESCE(status, ''), COUNT(*)
+        FROM messages GROUP BY 1, 2;
+
+    CREATE TRIGGER IF NOT EXISTS trg_messages_count_insert AFTER INSERT ON messages
+    BEGIN
+        INSERT INTO message_counters (day, status, count)
+            VALUES (substr(NEW.sent_at, 1, 10), COALESCE(NEW.status, ''), 1)
+            ON CONFLICT (day, status) DO UPDATE SET count = count + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_messages_count_delete AFTER DELETE ON messages
+    BEGIN
+        UPDATE message_counters SET count = count - 1
+            WHERE day = substr(OLD.sent_at, 1, 10) AND status = COALESCE(OLD.status, '');
+    END;
+    """,
+    # 2: кампании и исходящая очередь для возобновления после сбоя
+    """
+    CREATE TABLE IF NOT EXISTS campaigns (
+        id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        source TEXT,
+        created_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS outbox (
+        campaign_id TEXT NOT NULL REFERENCES campaigns(id),
+        phone TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'queued',
+        answers TEXT NOT NULL DEFAULT '[]',
+        updated_at TEXT,
+        PRIMARY KEY (campaign_id, phone)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_outbox_state ON outbox(campaign_id, state);
+    """,
+    # 3: заранее созданные встречи Zoom и их выдача участникам
+    """
+    CREATE TABLE IF NOT EXISTS zoom_meetings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        join_url TEXT NOT NULL UNIQUE,
+        created_at TEXT NOT NULL,
+        allocated_to TEXT,
+        allocated_at TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_zoom_meetings_free ON zoom_meetings(id) WHERE allocated_to IS NULL;
+    """,
+    # 4: гистограммы задержек по этапам (см. src/metrics.py)
+    """
+    CREATE TABLE IF NOT EXISTS latency_buckets (
+        stage TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (stage, bucket)
+    ) WITHOUT ROWID;
+    """,
+    # 5: результаты опросов по полям для отчётов; старые ответы из
+    # ``users.answers`` переносятся без признака отбора (он не сохранялся)
+    """
+    CREATE TABLE IF NOT EXISTS survey_responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone TEXT NOT NULL,
+        name TEXT,
+        campaign_id TEXT,
+        age INTEGER,
+        education TEXT,
+        gender TEXT,
+        completed INTEGER NOT NULL DEFAULT 0,
+        qualified INTEGER,
+        zoom_link TEXT,
+        started_at TEXT,
+        finished_at TEXT NOT NULL
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_survey_responses_phone ON survey_responses(phone);
+    CREATE INDEX IF NOT EXISTS idx_survey_responses_finished ON survey_responses(finished_at);
+    CREATE INDEX IF NOT EXISTS idx_survey_responses_campaign ON survey_responses(campaign_id, finished_at);
+    CREATE INDEX IF NOT EXISTS idx_survey_responses_qualified ON survey_responses(qualified, finished_at);
+
+    INSERT INTO survey_responses (phone, name, age, education, gender, completed, finished_at)
+        SELECT phone, name,
+               CASE WHEN a1 <> '' AND a1 NOT GLOB '*[^0-9]*' THEN CAST(a1 AS INTEGER) END,
+               NULLIF(lower(trim(substr(rest, 1, instr(rest || '|', '|') - 1))), ''),
+               NULLIF(lower(trim(substr(rest, instr(rest || '|', '|') + 1))), ''),
+               length(answers) - length(replace(answers, '|', '')) >= 2,
+               COALESCE(survey_date, '')
+        FROM (
+            SELECT phone, name, survey_date, answers,
+                   trim(substr(answers, 1, instr(answers || '|', '|') - 1)) AS a1,
+                   substr(answers, instr(answers || '|', '|') + 1) AS rest
+            FROM users WHERE answers IS NOT NULL
+        ) AS u
+        WHERE NOT EXISTS (SELECT 1 FROM survey_responses r WHERE r.phone = u.phone);
+    """,
+    # 6: последнее обработанное входящее сообщение по чатам (см. src/cursors.py)
+    """
+    CREATE TABLE IF NOT EXISTS chat_cursors (
+        account TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        message_id TEXT NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (account, phone)
+    ) WITHOUT ROWID;
+    """,
+    # 7: действующие и недействующие номера по последней отправке (см.
+    # ``PhoneRegistry`` в src/phones.py); номера без ``+`` в журнале
+    # записаны цифрами с кодом страны
+    """
+    CREATE TABLE IF NOT EXISTS phone_status (
+        phone TEXT PRIMARY KEY,
+        valid INTEGER NOT NULL,
+        checked_at TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_phone_status_checked ON phone_status(checked_at);
+
+    INSERT INTO phone_status (phone, valid, checked_at)
+        SELECT CASE WHEN user_phone LIKE '+%' THEN user_phone ELSE '+' || user_phone END,
+               status = 'sent', sent_at
+        FROM messages
+        WHERE status IN ('sent', 'invalid_number') AND COALESCE(user_phone, '') <> '' AND sent_at IS NOT NULL
+        ORDER BY sent_at
+        ON CONFLICT (phone) DO UPDATE SET valid = excluded.valid, checked_at = excluded.checked_at
+            WHERE excluded.checked_at >= phone_status.checked_at;
+
+    CREATE TRIGGER IF NOT EXISTS trg_messages_phone_status AFTER INSERT ON messages
+    WHEN NEW.status IN ('sent', 'invalid_number') AND COALESCE(NEW.user_phone, '') <> ''
+    BEGIN
+        INSERT INTO phone_status (phone, valid, checked_at)
+            VALUES (
+                CASE WHEN NEW.user_phone LIKE '+%' THEN NEW.user_phone ELSE '+' || NEW.user_phone END,
+                NEW.status = 'sent',
+                NEW.sent_at
+            )
+            ON CONFLICT (phone) DO UPDATE SET valid = excluded.valid, checked_at = excluded.checked_at;
+    END;
+    """,
+    # 8: нижний регистр перенесённых ответов; lower() в SQLite меняет только
+    # латиницу, и «Высшее» из шага 5 не совпадало с «высшее» новых опросов
+    """
+    UPDATE survey_responses
+        SET education = unicode_lower(education), gender = unicode_lower(gender)
+        WHERE education IS NOT unicode_lower(education) OR gender IS NOT unicode_lower(gender);
+    """,
+]
+
+
+def _unicode_lower(value: Optional[str]) -> Optional[str]:
+    """``str.lower`` для SQL: тот же регистр, что у ответов новых опросов."""
+    return value.lower() if isinstance(value, str) else value
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -37,6 +225,29 @@ def init_db(conn: sqlite3.Connection) -> None:
     )
     conn.commit()
 
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Создать базовые таблицы и применить недостающие миграции схемы.
+
+    Повторный вызов ничего не делает, поэтому функцию можно вызывать перед
+    каждой командой.
+    """
+    _create_base_tables(conn)
+    conn.create_function("unicode_lower", 1, _unicode_lower, deterministic=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(_MIGRATIONS[version:], start=version + 1):
+        try:
+            conn.executescript(f"BEGIN;\n{script}\nPRAGMA user_version = {number};\nCOMMIT;")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+
+def init_db(conn: sqlite3.Connection) -> None:
+    """Создать таблицы при отсутствии, применить миграции и добавить примеры данных."""
+    cursor = conn.cursor()
+    migrate(conn)
+
     # Вставить пример данных, если таблицы пусты
     cursor.execute("SELECT COUNT(*) FROM users")
     if cursor.fetchone()[0] == 0:
@@ -61,6 +272,78 @@ def init_db(conn: sqlite3.Connection) -> None:
         conn.commit()
 
 
+def message_totals(conn: sqlite3.Connection, since: Optional[str] = None) -> List[Tuple[str, int]]:
+    """Вернуть число сообщений по статусам из таблицы счётчиков.
+
+    ``since`` — дата ``YYYY-MM-DD``, начиная с которой учитываются сообщения.
+    """
+    return conn.execute(
+        "SELECT status, SUM(count) FROM message_counters WHERE day >= ? "
+        "GROUP BY status HAVING SUM(count) > 0 ORDER BY 2 DESC",
+        (since or "",),
+    ).fetchall()
+
+
+def daily_totals(conn: sqlite3.Connection, since: str) -> List[Tuple[str, str, int]]:
+    """Вернуть число сообщений по дням и статусам начиная с ``since``."""
+    return conn.execute(
+        "SELECT day, status, count FROM message_counters WHERE day >= ? AND count > 0 "
+        "ORDER BY day, status",
+        (since,),
+    ).fetchall()
+
+
+def survey_funnel(
+    conn: sqlite3.Connection, campaign_id: Optional[str] = None, since: Optional[str] = None
+) -> List[Tuple[str, int]]:
+    """Вернуть воронку опроса: сколько номеров дошло до каждого этапа.
+
+    Первые этапы считаются по ``outbox`` опросных кампаний, последние — по
+    ``survey_responses``. ``since`` — дата ``YYYY-MM-DD``.
+    """
+    since = since or ""
+    outbox = conn.execute(
+        "SELECT COUNT(*), "
+        "COALESCE(SUM(o.state IN ('sent', 'replied', 'finished')), 0), "
+        "COALESCE(SUM(o.state IN ('replied', 'finished')), 0), "
+        "COALESCE(SUM(o.state = 'finished'), 0) "
+        "FROM outbox o JOIN campaigns c ON c.id = o.campaign_id "
+        "WHERE c.kind = 'survey' AND (?1 IS NULL OR o.campaign_id = ?1) AND COALESCE(o.updated_at, '') >= ?2",
+        (campaign_id, since),
+    ).fetchone()
+    responses = conn.execute(
+        "SELECT COALESCE(SUM(completed), 0), COALESCE(SUM(qualified = 1), 0), "
+        "COALESCE(SUM(qualified = 1 AND zoom_link IS NOT NULL), 0) "
+        "FROM survey_responses WHERE (?1 IS NULL OR campaign_id = ?1) AND finished_at >= ?2",
+        (campaign_id, since),
+    ).fetchone()
+    stages = ("contacts", "asked", "replied", "finished", "completed", "qualified", "invited")
+    return list(zip(stages, outbox + responses))
+
+
+# Поля разбивки отчёта и соответствующие выражения SQL
+BREAKDOWNS = {
+    "age": "CASE WHEN age IS NULL THEN NULL ELSE ((age / 5) * 5) || '-' || ((age / 5) * 5 + 4) END",
+    "education": "education",
+    "gender": "gender",
+    "campaign": "campaign_id",
+    "day": "substr(finished_at, 1, 10)",
+}
+
+
+def survey_breakdown(
+    conn: sqlite3.Connection, by: str, campaign_id: Optional[str] = None, since: Optional[str] = None
+) -> List[Tuple[Optional[str], int, int, int]]:
+    """Вернуть ``(значение, ответов, завершено, прошли отбор)`` по полю ``by``."""
+    expr = BREAKDOWNS[by]
+    return conn.execute(
+        f"SELECT {expr} AS value, COUNT(*), SUM(completed), COALESCE(SUM(qualified = 1), 0) "
+        "FROM survey_responses WHERE (?1 IS NULL OR campaign_id = ?1) AND finished_at >= ?2 "
+        "GROUP BY value ORDER BY 2 DESC",
+        (campaign_id, since or ""),
+    ).fetchall()
+
+
 def log_message(conn: sqlite3.Connection, user_phone: str, message_text: str, status: str) -> int:
     """Добавить запись в таблицу сообщений и вернуть её ID."""
     cursor = conn.cursor()
@@ -82,6 +365,261 @@ def save_user_survey(conn: sqlite3.Connection, phone: str, name: str, answers: s
     conn.commit()
 
 
+_INSERT_MESSAGE = "INSERT INTO messages (user_phone, message_text, status, sent_at) VALUES (?, ?, ?, ?)"
+_UPSERT_USER = "INSERT OR REPLACE INTO users (phone, name, survey_date, answers) VALUES (?, ?, ?, ?)"
+_INSERT_RESPONSE = (
+    "INSERT INTO survey_responses (phone, name, campaign_id, age, education, gender, completed, "
+    "qualified, zoom_link, started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class DatabaseWriter:
+    """Единственный поток записи в SQLite с пакетной фиксацией.
+
+    Записи ставятся в очередь и сбрасываются одной транзакцией через
+    ``executemany``, когда набирается ``batch_size`` строк или проходит
+    ``flush_interval`` секунд. Каждый вызов возвращает :class:`Future`,
+    который завершается только после ``COMMIT``: подтверждённая запись уже
+    лежит на диске и не теряется при падении процесса. Пакет, упёршийся в
+    блокировку другого процесса, повторяется, а если он так и не записался,
+    команды записываются по отдельности: ошибка одной строки не отменяет
+    остальные и попадает в журнал. Если поток не смог
+    открыть базу или упал, ожидающие записи завершаются его ошибкой, а
+    следующие вызовы :meth:`execute` выбрасывают :class:`RuntimeError`.
+    """
+
+    def __init__(self, path: Path = DB_PATH, batch_size: int = 200, flush_interval: float = 0.5) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Tuple[str, tuple, Future] | None]" = queue.Queue()
+        self._closed = False
+        # ошибка, остановившая поток записи
+        self._error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def execute(self, sql: str, params: tuple = ()) -> Future:
+        """Поставить в очередь произвольную команду изменения данных."""
+        if self._closed:
+            raise RuntimeError("Database writer is closed")
+        future: Future = Future()
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError("Database writer has failed") from self._error
+            self._queue.put((sql, params, future))
+        return future
+
+    def log_message(self, user_phone: str, message_text: str, status: str) -> Future:
+        """Поставить в очередь запись в таблицу сообщений."""
+        return self.execute(_INSERT_MESSAGE, (user_phone, message_text, status, datetime.utcnow().isoformat()))
+
+    def save_user_survey(self, phone: str, name: str, answers: str) -> Future:
+        """Поставить в очередь сохранение ответов пользователя."""
+        return self.execute(_UPSERT_USER, (phone, name, datetime.utcnow().isoformat(), answers))
+
+    def save_survey_response(
+        self,
+        phone: str,
+        name: str,
+        *,
+        age: Optional[int],
+        education: Optional[str],
+        gender: Optional[str],
+        completed: bool,
+        qualified: bool,
+        zoom_link: Optional[str] = None,
+        campaign_id: Optional[str] = None,
+        started_at: Optional[str] = None,
+    ) -> Future:
+        """Поставить в очередь запись результата опроса в ``survey_responses``."""
+        return self.execute(
+            _INSERT_RESPONSE,
+            (
+                phone,
+                name,
+                campaign_id,
+                age,
+                education,
+                gender,
+                int(completed),
+                int(qualified),
+                zoom_link,
+                started_at,
+                datetime.utcnow().isoformat(),
+            ),
+        )
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Дождаться фиксации всех записей, поставленных до вызова."""
+        self.execute("", ()).result(timeout)
+
+    def close(self) -> None:
+        """Сбросить очередь на диск и остановить поток записи."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self) -> Tuple[List[Tuple[str, tuple, Future]], bool]:
+        """Набрать пакет записей; второй элемент — признак остановки."""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+            if not item[0]:
+                # явный flush: не ждём окончания интервала
+                break
+        return batch, False
+
+    def _write(self, conn: sqlite3.Connection, batch: List[Tuple[str, tuple, Future]]) -> None:
+        grouped: dict[str, List[Tuple[tuple, Future]]] = {}
+        for sql, params, future in batch:
+            if sql:
+                grouped.setdefault(sql, []).append((params, future))
+        started = time.monotonic()
+        for attempt in range(_BUSY_RETRIES + 1):
+            try:
+                with conn:
+                    for sql, items in grouped.items():
+                        conn.executemany(sql, [params for params, _ in items])
+            except sqlite3.OperationalError as exc:
+                if _is_busy(exc) and attempt < _BUSY_RETRIES:
+                    time.sleep(_BUSY_BACKOFF * 2 ** attempt)
+                    continue
+                self._write_separately(conn, grouped, exc)
+                break
+            except sqlite3.Error as exc:
+                self._write_separately(conn, grouped, exc)
+                break
+            else:
+                # импорт здесь: metrics сам пишет через этот поток
+                from .metrics import _UPSERT_BUCKET, observe
+
+                # сброс самих гистограмм не измеряется: иначе каждый сброс
+                # заводил бы следующий, и простаивающий процесс писал бы вечно
+                if grouped and set(grouped) != {_UPSERT_BUCKET}:
+                    observe("db_write", time.monotonic() - started)
+                break
+        for _, _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    @staticmethod
+    def _write_separately(
+        conn: sqlite3.Connection, grouped: dict[str, List[Tuple[tuple, Future]]], exc: sqlite3.Error
+    ) -> None:
+        """Записать команды пакета группами, а неудавшиеся группы — по строкам."""
+        logger.warning("Batch write failed (%s); writing statements separately", exc)
+        for sql, items in grouped.items():
+            try:
+                with conn:
+                    conn.executemany(sql, [params for params, _ in items])
+                continue
+            except sqlite3.Error:
+                pass
+            for params, future in items:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except sqlite3.Error as row_exc:
+                    logger.error("Dropped database write %r with %r: %s", sql, params, row_exc)
+                    future.set_exception(row_exc)
+
+    def _fail(self, exc: BaseException, batch: List[Tuple[str, tuple, Future]]) -> None:
+        """Завершить ошибкой ``exc`` текущий пакет и всё, что стоит в очереди."""
+        with self._lock:
+            self._error = exc
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    batch.append(item)
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+
+    def _run(self) -> None:
+        try:
+            # несколько процессов (аккаунтов) пишут в одну базу: ждём блокировку дольше
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        except Exception as exc:
+            self._fail(exc, [])
+            return
+        batch: List[Tuple[str, tuple, Future]] = []
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            migrate(conn)
+            stop = False
+            while not stop:
+                batch, stop = self._collect()
+                if batch:
+                    self._write(conn, batch)
+                batch = []
+            # дописать всё, что успели поставить после сигнала остановки
+            rest = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    rest.append(item)
+            if rest:
+                batch = rest
+                self._write(conn, batch)
+        except Exception as exc:
+            self._fail(exc, batch)
+        finally:
+            conn.close()
+
+
+def _is_busy(exc: sqlite3.OperationalError) -> bool:
+    """Проверить, что ошибка вызвана блокировкой базы другим соединением."""
+    message = str(exc).lower()
+    return "locked" in message or "busy" in message
+
+
+_WRITER: DatabaseWriter | None = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_writer() -> DatabaseWriter:
+    """Вернуть общий поток записи, запуская его при первом обращении."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None or _WRITER._closed or _WRITER._error is not None:
+            _WRITER = DatabaseWriter()
+        return _WRITER
+
+
+def close_writer() -> None:
+    """Сбросить и остановить общий поток записи."""
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is not None:
+            _WRITER.close()
+            _WRITER = None
+
+
+atexit.register(close_writer)
+
+
 if __name__ == "__main__":
     with get_connection() as connection:
         init_db(connection)
@@ -0,0 +1,101 @@
+"""Потоковое чтение списков контактов и обработка фиксированным пулом потоков."""
+
+from __future__ import annotations
+
+import csv
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TypeVar
+
+from . import config
+from .phones import normalize_phone
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class Contact(NamedTuple):
+    """Строка входного CSV после нормализации."""
+
+    phone: str
+    message: Optional[str] = None
+
+
+def iter_contacts(csv_file: Path, country_code: Optional[str] = None) -> Iterator[Contact]:
+    """Лениво читать контакты из CSV, нормализуя и убирая повторы номеров.
+
+    Поддерживаются файлы с заголовком (колонки ``phone`` и необязательная
+    ``message``) и без него (номер в первой колонке). Номера приводятся к
+    E.164; записанные без кода страны дополняются ``country_code`` (по
+    умолчанию ``PHONE_COUNTRY_CODE``), а некорректные пропускаются. В
+    памяти хранится только множество уже встреченных номеров.
+    """
+    country_code = country_code or config.get("PHONE_COUNTRY_CODE")
+    seen: set[str] = set()
+    with open(csv_file, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        first = next(reader, None)
+        if first is None:
+            return
+        header = [col.strip().lower() for col in first]
+        if "phone" in header:
+            phone_col = header.index("phone")
+            message_col = header.index("message") if "message" in header else None
+            rows: Iterable[list[str]] = reader
+        else:
+            phone_col, message_col = 0, None
+            rows = _chain_first(first, reader)
+
+        for row in rows:
+            if len(row) <= phone_col:
+                continue
+            phone = normalize_phone(row[phone_col], country_code)
+            if not phone or phone in seen:
+                continue
+            seen.add(phone)
+            message = row[message_col] if message_col is not None and len(row) > message_col else None
+            yield Contact(phone, message or None)
+
+
+def _chain_first(first: list[str], rest: Iterator[list[str]]) -> Iterator[list[str]]:
+    yield first
+    yield from rest
+
+
+def run_bounded(
+    items: Iterable[T],
+    handler: Callable[[T], None],
+    workers: int = 1,
+    queue_size: Optional[int] = None,
+) -> None:
+    """Обработать ``items`` фиксированным числом потоков через ограниченную очередь.
+
+    Источник читается по мере освобождения места в очереди, поэтому число
+    потоков и объём памяти не зависят от размера входных данных. Исключение
+    в ``handler`` записывается в журнал и не останавливает остальных
+    обработчиков.
+    """
+    tasks: "queue.Queue[T | None]" = queue.Queue(maxsize=queue_size or workers * 2)
+
+    def worker() -> None:
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            try:
+                handler(item)
+            except Exception:
+                logger.exception("Handler failed for %r", item)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(workers, 1))]
+    for thread in threads:
+        thread.start()
+    for item in items:
+        tasks.put(item)
+    for _ in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
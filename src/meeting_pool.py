@@ -0,0 +1,159 @@
+"""Пул заранее созданных встреч Zoom для мгновенной выдачи ссылок."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Mapping, Optional
+
+from . import config
+from .database import DB_PATH, get_connection, migrate
+from .zoom import create_meeting
+
+# Повторяющаяся встреча без фиксированного времени: ссылка действует долго
+# и не привязана к моменту создания
+_MEETING_PAYLOAD = {"topic": "Interview", "type": 3}
+
+
+class MeetingPool:
+    """Запас из ``target`` свободных встреч в таблице ``zoom_meetings``.
+
+    :meth:`allocate` атомарно закрепляет свободную встречу за участником,
+    так что каждая ссылка выдаётся один раз, а фоновый поток досоздаёт
+    встречи через ``create`` до целевого размера. Если запас пуст,
+    встреча создаётся синхронно.
+
+    Поток пополнения запускается явно через :meth:`start` одним процессом
+    на базу (командой ``survey``; при ``--sharded`` — координатором):
+    процессы аккаунтов только расходуют запас, иначе каждый досоздавал бы
+    встречи до ``target`` сам. Расход другими процессами поток замечает,
+    проверяя запас раз в ``poll_interval`` секунд.
+    """
+
+    def __init__(
+        self,
+        target: int = 5,
+        *,
+        create: Callable[[Mapping[str, Any]], str] = create_meeting,
+        path: Path = DB_PATH,
+        retry_interval: float = 30.0,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.target = target
+        self.create = create
+        self.path = path
+        self.retry_interval = retry_interval
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        conn = get_connection(path)
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
+
+    def available(self) -> int:
+        """Число свободных встреч в запасе."""
+        conn = get_connection(self.path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM zoom_meetings WHERE allocated_to IS NULL").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _store(self, conn: sqlite3.Connection, url: str, phone: Optional[str] = None) -> None:
+        now = datetime.utcnow().isoformat()
+        conn.execute(
+            "INSERT INTO zoom_meetings (join_url, created_at, allocated_to, allocated_at) VALUES (?, ?, ?, ?)",
+            (url, now, phone, now if phone else None),
+        )
+
+    def allocate(self, phone: str) -> str:
+        """Выдать участнику свободную ссылку и разбудить пополнение запаса."""
+        conn = get_connection(self.path)
+        try:
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, join_url FROM zoom_meetings WHERE allocated_to IS NULL ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE zoom_meetings SET allocated_to = ?, allocated_at = ? WHERE id = ?",
+                        (phone, datetime.utcnow().isoformat(), row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row is not None:
+                self._wake.set()
+                return row[1]
+
+            # запас исчерпан — создать встречу прямо сейчас
+            url = self.create(_MEETING_PAYLOAD)
+            with conn:
+                self._store(conn, url, phone)
+            self._wake.set()
+            return url
+        finally:
+            conn.close()
+
+    def refill(self) -> int:
+        """Досоздать встречи до целевого размера и вернуть число созданных."""
+        created = 0
+        missing = self.target - self.available()
+        if missing <= 0:
+            return 0
+        conn = get_connection(self.path)
+        try:
+            for _ in range(missing):
+                url = self.create(_MEETING_PAYLOAD)
+                with conn:
+                    self._store(conn, url)
+                created += 1
+        finally:
+            conn.close()
+        return created
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refill()
+                timeout = self.poll_interval
+            except Exception:
+                # Zoom недоступен — попробовать позже
+                timeout = self.retry_interval
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def start(self) -> MeetingPool:
+        """Запустить фоновое пополнение, если оно ещё не запущено."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="zoom-meeting-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Остановить фоновое пополнение."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_POOL: MeetingPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_meeting_pool() -> MeetingPool:
+    """Вернуть общий пул встреч; размер задаётся ``ZOOM_MEETING_POOL``."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = MeetingPool(int(config.get("ZOOM_MEETING_POOL", "5") or 5))
+        return _POOL
@@ -0,0 +1,40 @@
+"""Измерение памяти процессов браузера."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_PROC = Path("/proc")
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Вернуть суммарный RSS процесса и всех его потомков в байтах.
+
+    Работает через ``/proc``; на системах без него возвращает ``None``.
+    """
+    if not _PROC.exists():
+        return None
+    children: Dict[int, List[int]] = {}
+    for entry in _PROC.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # имя процесса в скобках может содержать пробелы
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            for line in (_PROC / str(current) / "status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+                    break
+        except OSError:
+            pass
+        stack.extend(children.get(current, []))
+    return total
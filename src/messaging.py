@@ -0,0 +1,21 @@
+"""Общие для всех транспортов сообщения и таймауты; без зависимости от Selenium."""
+
+from __future__ import annotations
+
+from typing import Dict, NamedTuple
+
+# --- Константы конфигурации ---
+DEFAULT_TIMEOUTS: Dict[str, int] = {
+    "load_chat": 30,
+    "button_click": 5,
+    "send_check": 10,
+    "reply_check": 60,
+}
+
+
+class IncomingMessage(NamedTuple):
+    """Входящее сообщение, найденное при просмотре чатов."""
+
+    phone: str
+    text: str
+    timestamp: float
@@ -0,0 +1,179 @@
+"""Гистограммы задержек по этапам и отчёт по перцентилям."""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .database import get_writer
+
+# Верхние границы корзин в секундах: от 1 мс до ~4 мин с шагом ×√2,
+# последняя корзина (+Inf) имеет индекс len(BUCKETS)
+BUCKETS: List[float] = [0.001 * 2 ** (i / 2) for i in range(37)]
+
+# Этапы, которые измеряются в горячем пути
+STAGES = (
+    "chat_load",
+    "input",
+    "send_click",
+    "send_confirm",
+    "reply_wait",
+    "zoom_token",
+    "zoom_meeting",
+    "db_write",
+)
+
+_UPSERT_BUCKET = (
+    "INSERT INTO latency_buckets (stage, bucket, count, total) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (stage, bucket) DO UPDATE SET "
+    "count = count + excluded.count, total = total + excluded.total"
+)
+
+
+class LatencyRecorder:
+    """Накопитель гистограмм задержек в памяти.
+
+    :meth:`observe` только увеличивает счётчик корзины под блокировкой;
+    накопленные приращения периодически (и при выходе) сбрасываются в
+    таблицу ``latency_buckets`` через общий :class:`DatabaseWriter`.
+    """
+
+    def __init__(self, persist_interval: float = 10.0) -> None:
+        self.persist_interval = persist_interval
+        self._pending: Dict[Tuple[str, int], List[float]] = {}
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Учесть одно измерение этапа ``stage``."""
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            entry = self._pending.setdefault((stage, bucket), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            if self._timer is None:
+                self._timer = threading.Timer(self.persist_interval, self.persist)
+                self._timer.daemon = True
+                self._timer.start()
+
+    @contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Измерить время выполнения блока ``with``."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.monotonic() - started)
+
+    def persist(self) -> None:
+        """Записать накопленные приращения в базу."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending:
+            return
+        writer = get_writer()
+        for (stage, bucket), (count, total) in pending.items():
+            writer.execute(_UPSERT_BUCKET, (stage, bucket, count, total))
+
+
+_RECORDER = LatencyRecorder()
+atexit.register(_RECORDER.persist)
+
+
+def get_recorder() -> LatencyRecorder:
+    """Вернуть общий накопитель задержек процесса."""
+    return _RECORDER
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Учесть измерение в общем накопителе."""
+    _RECORDER.observe(stage, seconds)
+
+
+def timed(stage: str):
+    """Контекстный менеджер, измеряющий блок в общем накопителе."""
+    return _RECORDER.timed(stage)
+
+
+class StageLatency(NamedTuple):
+    """Сводка задержек одного этапа."""
+
+    stage: str
+    count: int
+    mean: float
+    p50: float
+    p95: float
+    p99: float
+
+
+def _percentile(counts: List[int], total: int, q: float) -> float:
+    """Оценить перцентиль линейной интерполяцией внутри корзины."""
+    rank = q * total
+    seen = 0
+    for bucket, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = BUCKETS[bucket - 1] if bucket > 0 else 0.0
+            upper = BUCKETS[bucket] if bucket < len(BUCKETS) else BUCKETS[-1]
+            return lower + (upper - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+def _load_histograms(conn: sqlite3.Connection) -> Dict[str, Tuple[List[int], float]]:
+    """Прочитать счётчики корзин и сумму задержек по каждому этапу."""
+    stages: Dict[str, Tuple[List[int], float]] = {}
+    rows = conn.execute("SELECT stage, bucket, count, total FROM latency_buckets ORDER BY stage, bucket")
+    for stage, bucket, count, total in rows:
+        counts, sum_ = stages.get(stage, ([0] * (len(BUCKETS) + 1), 0.0))
+        counts[bucket] += count
+        stages[stage] = (counts, sum_ + total)
+    return stages
+
+
+def latency_summary(conn: sqlite3.Connection) -> List[StageLatency]:
+    """Вернуть p50/p95/p99 по каждому этапу из таблицы ``latency_buckets``."""
+    result = []
+    for stage, (counts, sum_) in _load_histograms(conn).items():
+        n = sum(counts)
+        if not n:
+            continue
+        result.append(
+            StageLatency(
+                stage,
+                n,
+                sum_ / n,
+                _percentile(counts, n, 0.50),
+                _percentile(counts, n, 0.95),
+                _percentile(counts, n, 0.99),
+            )
+        )
+    return result
+
+
+def write_prometheus(conn: sqlite3.Connection, path: Path) -> None:
+    """Выгрузить гистограммы в текстовом формате Prometheus."""
+    stages = _load_histograms(conn)
+    name = "whatsup_stage_latency_seconds"
+    lines = [
+        f"# HELP {name} Latency of bot pipeline stages.",
+        f"# TYPE {name} histogram",
+    ]
+    for stage, (counts, sum_) in sorted(stages.items()):
+        cumulative = 0
+        for bucket, upper in enumerate(BUCKETS):
+            cumulative += counts[bucket]
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{upper:g}"}} {cumulative}')
+        cumulative += counts[len(BUCKETS)]
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {sum_:.6f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {cumulative}')
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    tmp.replace(path)
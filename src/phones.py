@@ -0,0 +1,97 @@
+"""Работа с телефонными номерами."""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from . import config
+from .database import get_connection, get_writer, migrate
+
+# Национальный префикс выхода на междугороднюю связь по коду страны
+_TRUNK_PREFIX = {"7": "8"}
+
+# Статус отправки на номер, которого нет в WhatsApp
+INVALID_NUMBER = "invalid_number"
+
+# Сколько дней доверять результату прошлой отправки на номер
+INVALID_TTL_DAYS = 30
+VALID_TTL_DAYS = 90
+
+
+def phone_digits(phone: str) -> str:
+    """Оставить в номере только цифры, как в идентификаторах WhatsApp."""
+    return re.sub(r"\D", "", phone)
+
+
+def normalize_phone(phone: str, country_code: Optional[str] = None) -> Optional[str]:
+    """Привести номер к формату E.164 (``+79991234567``).
+
+    Номер с ``+`` или ``00`` считается международным. Остальные без
+    ``country_code`` тоже считаются записанными с кодом страны, а с ним
+    национальный префикс (``8`` для России, иначе ``0``) заменяется кодом
+    страны. Возвращает ``None``, если номер не может быть номером E.164.
+    """
+    raw = phone.strip()
+    digits = phone_digits(raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    elif country_code and not raw.startswith("+"):
+        trunk = _TRUNK_PREFIX.get(country_code, "0")
+        if digits.startswith(trunk) and not digits.startswith(country_code):
+            digits = digits[len(trunk):]
+        if not digits.startswith(country_code):
+            digits = country_code + digits
+    if not 7 <= len(digits) <= 15 or digits.startswith("0"):
+        return None
+    return f"+{digits}"
+
+
+class PhoneRegistry:
+    """Номера, о которых уже известно, есть ли они в WhatsApp.
+
+    Таблица ``phone_status`` заполняется триггером по журналу ``messages``:
+    статус ``sent`` отмечает номер действующим, ``invalid_number`` —
+    недействующим. Записи старше ``INVALID_TTL_DAYS`` и ``VALID_TTL_DAYS``
+    дней (настраиваются через ``PHONE_INVALID_TTL_DAYS`` и
+    ``PHONE_VALID_TTL_DAYS``) не учитываются: номер мог появиться в
+    WhatsApp или пропасть из него. Актуальные записи загружаются одним
+    запросом при создании.
+    """
+
+    def __init__(
+        self,
+        invalid_ttl_days: Optional[float] = None,
+        valid_ttl_days: Optional[float] = None,
+        now: Optional[datetime] = None,
+    ) -> None:
+        if invalid_ttl_days is None:
+            invalid_ttl_days = float(config.get("PHONE_INVALID_TTL_DAYS", INVALID_TTL_DAYS))
+        if valid_ttl_days is None:
+            valid_ttl_days = float(config.get("PHONE_VALID_TTL_DAYS", VALID_TTL_DAYS))
+        now = now or datetime.utcnow()
+        get_writer().flush()
+        conn = get_connection()
+        try:
+            migrate(conn)
+            rows = conn.execute(
+                "SELECT phone, valid FROM phone_status "
+                "WHERE checked_at >= CASE valid WHEN 0 THEN ? ELSE ? END",
+                (
+                    (now - timedelta(days=invalid_ttl_days)).isoformat(),
+                    (now - timedelta(days=valid_ttl_days)).isoformat(),
+                ),
+            ).fetchall()
+        finally:
+            conn.close()
+        self._known: Dict[str, bool] = {phone: bool(valid) for phone, valid in rows}
+
+    def status(self, phone: str) -> Optional[bool]:
+        """``True`` — номер в WhatsApp, ``False`` — нет, ``None`` — неизвестно."""
+        normalized = normalize_phone(phone)
+        return self._known.get(normalized) if normalized else None
+
+    def is_invalid(self, phone: str) -> bool:
+        """Проверить, что номер недавно оказался недействующим."""
+        return self.status(phone) is False
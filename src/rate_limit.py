@@ -0,0 +1,106 @@
+"""Адаптивное ограничение скорости исходящих сообщений одного аккаунта."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Optional
+
+from . import config
+
+# Статусы отправки, которые считаются признаком перегрузки аккаунта
+ERROR_STATUSES = {"invalid_number", "connection_error"}
+
+
+def _per_minute(key: str, default: float) -> float:
+    return float(config.get(key, str(default)) or default) / 60.0
+
+
+class AdaptiveRateLimiter:
+    """Token bucket, скорость которого подстраивается под результаты отправки.
+
+    Каждое успешное подтверждение быстрее ``target_latency`` добавляет
+    ``increase`` сообщений в секунду, а доля ошибок в окне последних
+    ``window`` отправок выше ``error_threshold`` или медленное
+    подтверждение умножают скорость на ``decrease`` (AIMD). Скорость всегда
+    остаётся в пределах ``[min_rate, max_rate]``.
+    """
+
+    def __init__(
+        self,
+        rate: float = 6 / 60,
+        *,
+        min_rate: float = 2 / 60,
+        max_rate: float = 20 / 60,
+        burst: float = 1.0,
+        target_latency: float = 5.0,
+        window: int = 20,
+        error_threshold: float = 0.2,
+        increase: float = 0.5 / 60,
+        decrease: float = 0.5,
+    ) -> None:
+        if not 0 < min_rate <= max_rate:
+            raise ValueError("Rate limits must satisfy 0 < min_rate <= max_rate")
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.burst = burst
+        self.target_latency = target_latency
+        self.error_threshold = error_threshold
+        self.increase = increase
+        self.decrease = decrease
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> AdaptiveRateLimiter:
+        """Создать ограничитель по параметрам ``WHATSAPP_*_PER_MINUTE``."""
+        return cls(
+            _per_minute("WHATSAPP_START_PER_MINUTE", 6),
+            min_rate=_per_minute("WHATSAPP_MIN_PER_MINUTE", 2),
+            max_rate=_per_minute("WHATSAPP_MAX_PER_MINUTE", 20),
+            target_latency=float(config.get("WHATSAPP_TARGET_LATENCY", "5") or 5),
+        )
+
+    @property
+    def per_minute(self) -> float:
+        """Текущая скорость в сообщениях в минуту."""
+        return self.rate * 60
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Дождаться разрешения на отправку и вернуть время ожидания в секундах."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def record(self, status: str, latency: Optional[float] = None) -> None:
+        """Учесть результат отправки и скорректировать скорость."""
+        with self._lock:
+            self._refill(time.monotonic())
+            failed = status in ERROR_STATUSES
+            self._outcomes.append(failed)
+            errors = sum(self._outcomes) / len(self._outcomes)
+            if failed and len(self._outcomes) >= 5 and errors >= self.error_threshold:
+                self.rate *= self.decrease
+                # новое окно, чтобы одна серия ошибок не снижала скорость повторно
+                self._outcomes.clear()
+            elif latency is not None and latency > self.target_latency:
+                self.rate *= self.decrease
+            elif not failed:
+                self.rate += self.increase
+            self.rate = min(max(self.rate, self.min_rate), self.max_rate)
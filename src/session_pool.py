@@ -0,0 +1,235 @@
+"""Пул долгоживущих сессий WhatsApp Web."""
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, NamedTuple, Optional, Sequence
+
+from selenium.common.exceptions import WebDriverException
+
+from . import config
+from .cursors import get_cursors
+from .rate_limit import AdaptiveRateLimiter
+from .whatsapp_sender import WhatsAppClient
+
+# Сессия, простоявшая дольше этого времени, проверяется перед выдачей
+HEALTH_CHECK_IDLE = 30.0
+
+# Как часто при выдаче сессии сверять её память с порогом перезапуска
+RSS_CHECK_INTERVAL = 60.0
+
+
+class SessionPoolError(Exception):
+    """Вызывается, когда свободную сессию не удалось получить."""
+
+
+class _Slot:
+    """Сессия пула вместе со временем последнего использования."""
+
+    def __init__(self, client: WhatsAppClient) -> None:
+        self.client = client
+        self.last_used = time.monotonic()
+        self.rss_checked_at = time.monotonic()
+        self.peak_rss = 0
+        self.recycles = 0
+
+
+class SessionMemory(NamedTuple):
+    """Память одной сессии пула в байтах."""
+
+    index: int
+    rss: Optional[int]
+    peak: int
+    recycles: int
+
+
+class SessionPool:
+    """Фиксированный набор прогретых экземпляров :class:`WhatsAppClient`.
+
+    Сессии создаются один раз и выдаются на время одной операции через
+    :meth:`session`. Зависшая или упавшая сессия перезапускается с тем же
+    профилем, а не пересоздаётся для каждого собеседника. Если задан
+    ``max_rss_mb``, сессия, чей браузер занял больше памяти, перезапускается
+    при очередной выдаче.
+
+    Все сессии пула — устройства одного аккаунта, поэтому ``factory``
+    вызывается с общим для пула ``limiter`` (по умолчанию — по параметрам
+    ``WHATSAPP_*_PER_MINUTE``): темп отправки ограничивается для аккаунта,
+    а не для каждой сессии. Chrome не запускает два браузера с одним
+    каталогом профиля, поэтому при ``profiles`` каждая сессия получает свой
+    профиль: ``factory`` вызывается ещё и с ``profile_path`` и общими для
+    пула ``cursors``.
+    """
+
+    def __init__(
+        self,
+        size: int = 1,
+        factory: Optional[Callable[..., WhatsAppClient]] = None,
+        acquire_timeout: float = 300.0,
+        max_rss_mb: Optional[float] = None,
+        profiles: Optional[Sequence[str]] = None,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+    ) -> None:
+        if size < 1:
+            raise ValueError("Pool size must be positive")
+        if profiles is not None and len(profiles) < size:
+            raise ValueError(f"Pool of {size} sessions needs {size} Chrome profiles, got {len(profiles)}")
+        self.size = size
+        self.factory = factory or WhatsAppClient
+        self.profiles = list(profiles) if profiles else None
+        self.limiter = limiter or AdaptiveRateLimiter.from_config()
+        self.acquire_timeout = acquire_timeout
+        if max_rss_mb is None:
+            max_rss_mb = float(config.get("WHATSAPP_MAX_RSS_MB", "0") or 0)
+        self.max_rss = int(max_rss_mb * 2 ** 20)
+        self._idle: "queue.Queue[_Slot]" = queue.Queue()
+        self._slots: List[_Slot] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def warm(self) -> None:
+        """Заранее запустить все сессии пула."""
+        while self._grow():
+            pass
+
+    def _grow(self) -> bool:
+        with self._lock:
+            if self._closed or len(self._slots) >= self.size:
+                return False
+            if self.profiles:
+                client = self.factory(
+                    limiter=self.limiter,
+                    profile_path=self.profiles[len(self._slots)],
+                    cursors=get_cursors(self.profiles[0]),
+                )
+            else:
+                client = self.factory(limiter=self.limiter)
+            slot = _Slot(client)
+            self._slots.append(slot)
+        self._idle.put(slot)
+        return True
+
+    def _checkout(self) -> _Slot:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        self._grow()
+        try:
+            return self._idle.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise SessionPoolError("No WhatsApp session became available") from None
+
+    def _ensure_healthy(self, slot: _Slot) -> None:
+        now = time.monotonic()
+        idle = now - slot.last_used
+        if slot.client.driver is None or (idle > HEALTH_CHECK_IDLE and not slot.client.is_alive()):
+            slot.client.restart()
+        elif self.max_rss and now - slot.rss_checked_at >= RSS_CHECK_INTERVAL:
+            slot.rss_checked_at = now
+            rss = self._measure(slot)
+            if rss is not None and rss > self.max_rss:
+                slot.client.restart()
+                slot.recycles += 1
+
+    @staticmethod
+    def _measure(slot: _Slot) -> Optional[int]:
+        rss = slot.client.rss()
+        if rss is not None:
+            slot.peak_rss = max(slot.peak_rss, rss)
+        return rss
+
+    def memory(self) -> List[SessionMemory]:
+        """Измерить текущую и пиковую память каждой сессии."""
+        with self._lock:
+            slots = list(self._slots)
+        report = []
+        for index, slot in enumerate(slots):
+            rss = self._measure(slot)
+            report.append(SessionMemory(index, rss, slot.peak_rss, slot.recycles))
+        return report
+
+    @contextmanager
+    def session(self) -> Iterator[WhatsAppClient]:
+        """Выдать сессию на время блока ``with`` и вернуть её в пул.
+
+        При ``WebDriverException`` браузер перезапускается, а исключение
+        пробрасывается вызывающему коду.
+        """
+        if self._closed:
+            raise SessionPoolError("Session pool is closed")
+        slot = self._checkout()
+        try:
+            self._ensure_healthy(slot)
+            yield slot.client
+        except WebDriverException:
+            try:
+                slot.client.restart()
+            except WebDriverException:
+                # следующая выдача попробует запустить браузер ещё раз
+                slot.client.close()
+            raise
+        finally:
+            slot.last_used = time.monotonic()
+            self._idle.put(slot)
+
+    def close(self) -> None:
+        """Закрыть все браузеры пула."""
+        with self._lock:
+            self._closed = True
+            slots = list(self._slots)
+            self._slots.clear()
+        for slot in slots:
+            slot.client.close()
+
+    def __enter__(self) -> SessionPool:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def session_profiles(size: int) -> Optional[List[str]]:
+    """Вернуть профили Chrome для ``size`` сессий из ``WHATSAPP_SESSION_PROFILES``.
+
+    Одной сессии профиль не нужен (используется ``CHROME_PROFILE_DIR``), а
+    для нескольких профилей должно быть не меньше, чем сессий.
+    """
+    profiles = config.get_list("WHATSAPP_SESSION_PROFILES")
+    if size > 1 and len(profiles) < size:
+        raise ValueError(
+            f"WHATSAPP_SESSIONS={size} needs a Chrome profile per session in "
+            f"WHATSAPP_SESSION_PROFILES, got {len(profiles)}"
+        )
+    return profiles[:size] or None
+
+
+_POOL: SessionPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> SessionPool:
+    """Вернуть общий пул процесса, создавая его при первом обращении.
+
+    Размер задаётся параметром ``WHATSAPP_SESSIONS`` (по умолчанию — по
+    числу профилей в ``WHATSAPP_SESSION_PROFILES`` или 1).
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL._closed:
+            default = len(config.get_list("WHATSAPP_SESSION_PROFILES")) or 1
+            size = int(config.get("WHATSAPP_SESSIONS", "") or default)
+            _POOL = SessionPool(size=size, profiles=session_profiles(size))
+        return _POOL
+
+
+def close_pool() -> None:
+    """Закрыть общий пул, если он был создан."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
@@ -0,0 +1,276 @@
+"""Распределение кампаний между несколькими аккаунтами WhatsApp.
+
+Каждый аккаунт (профиль Chrome) обслуживает отдельный процесс со своей
+сессией браузера и своим темпом отправки, а номера закрепляются за
+аккаунтами стабильным хешем, поэтому вопросы опроса и ответы на них
+всегда проходят через один и тот же аккаунт.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import multiprocessing
+import queue
+import threading
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import config
+from .campaign import FINISHED, Campaign, Progress
+from .ingest import Contact
+from .phones import INVALID_NUMBER
+
+if TYPE_CHECKING:
+    from .transport import Transport
+
+
+class ShardTask(NamedTuple):
+    """Задача для процесса аккаунта: отправить сообщение или провести опрос."""
+
+    phone: str
+    text: str
+    answers: List[str]
+
+
+class ShardResult(NamedTuple):
+    """Итог задачи; ``detail`` — статус отправки или результат отбора.
+
+    Результат с ``detail == "invalid_number"`` окончательный: номера нет в
+    WhatsApp, и другой аккаунт его тоже не доставит.
+    """
+
+    account: str
+    phone: str
+    ok: bool
+    detail: str
+
+
+def account_profiles() -> List[str]:
+    """Вернуть профили Chrome из ``CHROME_PROFILES``.
+
+    В ``config.json`` это список путей, в переменной окружения — пути через
+    запятую.
+    """
+    return config.get_list("CHROME_PROFILES")
+
+
+def shard_for(phone: str, accounts: Sequence[str]) -> str:
+    """Выбрать аккаунт для номера по rendezvous-хешу.
+
+    Номер остаётся за своим аккаунтом при любом составе остальных; если
+    аккаунт выбывает, переезжают только его номера.
+    """
+    if not accounts:
+        raise ValueError("No accounts to shard across")
+    return max(accounts, key=lambda account: hashlib.blake2b(f"{account}|{phone}".encode(), digest_size=8).digest())
+
+
+def selenium_transport(profile: str) -> Transport:
+    """Транспорт WhatsApp Web с одной сессией в профиле ``profile``."""
+    from .session_pool import SessionPool
+    from .transport import SeleniumTransport
+    from .whatsapp_sender import WhatsAppClient
+
+    return SeleniumTransport(SessionPool(1, factory=partial(WhatsAppClient, profile_path=profile)))
+
+
+def _send_worker(account: str, transport: Transport, campaign: Campaign, tasks, results) -> None:
+    for task in iter(tasks.get, None):
+        try:
+            status = transport.send(task.phone, task.text)
+        except Exception as exc:
+            results.put(ShardResult(account, task.phone, False, str(exc)))
+            continue
+        if status in ("sent", INVALID_NUMBER):
+            campaign.mark(task.phone, FINISHED)
+        results.put(ShardResult(account, task.phone, status == "sent", status))
+
+
+def _survey_worker(account: str, transport: Transport, campaign: Campaign, tasks, results) -> None:
+    from .survey_engine import Conversation, SurveyEngine
+
+    open_ = threading.Condition()
+    outstanding = [0]
+
+    def finished(conv: Conversation, qualified: bool) -> None:
+        if conv.phone in engine.invalid:
+            results.put(ShardResult(account, conv.phone, False, INVALID_NUMBER))
+        else:
+            ok = conv.phone not in engine.failed
+            results.put(ShardResult(account, conv.phone, ok, "qualified" if qualified else "not qualified"))
+        with open_:
+            outstanding[0] -= 1
+            open_.notify_all()
+
+    engine = SurveyEngine(transport=transport, on_finish=finished, campaign=campaign)
+
+    def feed() -> None:
+        for task in iter(tasks.get, None):
+            with open_:
+                outstanding[0] += 1
+            engine.enqueue(task.phone, task.phone, task.answers)
+        with open_:
+            open_.wait_for(lambda: outstanding[0] == 0)
+        engine.stop()
+
+    transport.subscribe(lambda m: engine.submit(m.phone, m.text))
+    threading.Thread(target=feed, daemon=True).start()
+    engine.run(until_idle=False)
+
+
+def _account_main(
+    account: str,
+    make_transport: Callable[[str], Transport],
+    kind: str,
+    campaign_id: str,
+    tasks,
+    results,
+) -> None:
+    """Точка входа процесса аккаунта."""
+    from .database import close_writer
+
+    transport = make_transport(account)
+    campaign = Campaign(campaign_id, kind, resume=True)
+    try:
+        worker = _survey_worker if kind == "survey" else _send_worker
+        worker(account, transport, campaign, tasks, results)
+    finally:
+        transport.close()
+        close_writer()
+
+
+class ShardCoordinator:
+    """Раздаёт задачи кампании процессам аккаунтов и следит за их здоровьем.
+
+    Аккаунт считается нездоровым, если его процесс завершился раньше
+    времени или ``max_failures`` задач подряд закончились ошибкой аккаунта
+    или браузера; недействующие номера ошибкой не считаются. Процесс
+    такого аккаунта останавливается, а его незавершённые задачи заново
+    распределяются между оставшимися аккаунтами с прогрессом из ``outbox``.
+    """
+
+    def __init__(
+        self,
+        accounts: Sequence[str],
+        make_transport: Callable[[str], Transport] = selenium_transport,
+        *,
+        kind: str,
+        campaign: Campaign,
+        max_inflight: int = 500,
+        max_failures: int = 5,
+        on_result: Optional[Callable[[ShardResult], None]] = None,
+    ) -> None:
+        if not accounts:
+            raise ValueError("No accounts to shard across")
+        self.accounts = list(dict.fromkeys(accounts))
+        self.make_transport = make_transport
+        self.kind = kind
+        self.campaign = campaign
+        self.max_inflight = max_inflight
+        self.max_failures = max_failures
+        self.on_result = on_result
+        self.healthy: List[str] = []
+        self.unhealthy: List[str] = []
+        self._ctx = multiprocessing.get_context("spawn")
+        self._results = self._ctx.Queue()
+        self._tasks: Dict[str, multiprocessing.Queue] = {}
+        self._procs: Dict[str, multiprocessing.Process] = {}
+        self._inflight: Dict[str, Dict[str, Tuple[Contact, ShardTask]]] = {}
+        # неудачные задачи подряд; при выбывании аккаунта они переезжают тоже
+        self._failures: Dict[str, List[Contact]] = {}
+        self._done: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """Запустить по процессу на каждый аккаунт."""
+        for account in self.accounts:
+            tasks = self._ctx.Queue()
+            proc = self._ctx.Process(
+                target=_account_main,
+                args=(account, self.make_transport, self.kind, self.campaign.id, tasks, self._results),
+                name=f"whatsup-{account}",
+                daemon=True,
+            )
+            proc.start()
+            self._tasks[account] = tasks
+            self._procs[account] = proc
+            self._inflight[account] = {}
+            self._failures[account] = []
+            self.healthy.append(account)
+
+    def run(self, pending: Iterable[Tuple[Contact, Progress]]) -> Dict[str, int]:
+        """Провести кампанию и вернуть число успешных задач по аккаунтам."""
+        if not self._procs:
+            self.start()
+        self._done = {account: 0 for account in self.accounts}
+        try:
+            for contact, progress in pending:
+                self._dispatch(contact, progress)
+            # процессы останавливаются только когда всё завершено: задачи
+            # выбывшего аккаунта ещё могут переехать к любому из них
+            while any(self._inflight[account] for account in self.healthy):
+                self._collect()
+            for account in self.healthy:
+                self._tasks[account].put(None)
+            for account in self.healthy:
+                self._procs[account].join()
+        finally:
+            self.close()
+        return self._done
+
+    def _dispatch(self, contact: Contact, progress: Progress) -> None:
+        while True:
+            if not self.healthy:
+                raise RuntimeError("No healthy WhatsApp accounts left")
+            account = shard_for(contact.phone, self.healthy)
+            if len(self._inflight[account]) < self.max_inflight:
+                break
+            self._collect()
+        text = contact.message or "Hello from WhatsUp bot!"
+        task = ShardTask(contact.phone, text, progress.answers)
+        self._inflight[account][contact.phone] = (contact, task)
+        self._tasks[account].put(task)
+
+    def _collect(self, timeout: float = 1.0) -> None:
+        """Обработать один результат или проверить процессы по таймауту."""
+        try:
+            result: ShardResult = self._results.get(timeout=timeout)
+        except queue.Empty:
+            for account in list(self.healthy):
+                if not self._procs[account].is_alive() and self._inflight[account]:
+                    self._fail(account)
+            return
+        entry = self._inflight[result.account].pop(result.phone, None)
+        if entry is None:
+            # результат выбывшего аккаунта по уже переданной задаче
+            return
+        if result.ok:
+            self._failures[result.account] = []
+            self._done[result.account] += 1
+        elif result.detail != INVALID_NUMBER:
+            self._failures[result.account].append(entry[0])
+        if self.on_result:
+            self.on_result(result)
+        if len(self._failures[result.account]) >= self.max_failures:
+            self._fail(result.account)
+
+    def _fail(self, account: str) -> None:
+        """Исключить аккаунт и перераспределить его незавершённые задачи."""
+        self.healthy.remove(account)
+        self.unhealthy.append(account)
+        proc = self._procs[account]
+        if proc.is_alive():
+            proc.terminate()
+        proc.join()
+        contacts = [contact for contact, _ in self._inflight[account].values()] + self._failures[account]
+        self._inflight[account] = {}
+        self._failures[account] = []
+        # прогресс перечитывается: часть вопросов могла быть уже задана
+        for contact, progress in self.campaign.pending(contacts):
+            self._dispatch(contact, progress)
+
+    def close(self) -> None:
+        """Остановить оставшиеся процессы."""
+        for proc in self._procs.values():
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
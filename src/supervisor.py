@@ -0,0 +1,204 @@
+"""Повтор операций WhatsApp Web после сбоев браузера и автоматический выключатель."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, TypeVar
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from . import config
+from .session_pool import SessionPool, get_pool
+from .whatsapp_sender import WhatsAppClient
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для сбоев браузера.
+
+    Если за ``window`` секунд случилось ``threshold`` сбоев, выключатель
+    размыкается, и :meth:`wait` задерживает все новые операции на
+    ``cooldown`` секунд. Затем проходит одна пробная операция: успех
+    замыкает выключатель, а сбой снова размыкает его на вдвое больший
+    срок, но не дольше ``max_cooldown``.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 5,
+        window: float = 60.0,
+        cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+    ) -> None:
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.trips = 0
+        self._failures: Deque[float] = deque()
+        self._open_until = 0.0
+        self._current_cooldown = cooldown
+        self._state = CLOSED
+        self._trial = False
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_config(cls) -> CircuitBreaker:
+        """Создать выключатель по параметрам ``WHATSAPP_BREAKER_*``."""
+        return cls(
+            threshold=int(config.get("WHATSAPP_BREAKER_FAILURES", "5") or 5),
+            window=float(config.get("WHATSAPP_BREAKER_WINDOW", "60") or 60),
+            cooldown=float(config.get("WHATSAPP_BREAKER_COOLDOWN", "30") or 30),
+        )
+
+    @property
+    def state(self) -> str:
+        """``closed``, ``open`` или ``half-open``."""
+        with self._cond:
+            if self._state == OPEN and time.monotonic() >= self._open_until:
+                return HALF_OPEN
+            return self._state
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Дождаться разрешения на операцию.
+
+        Возвращает ``False``, если за ``timeout`` секунд разрешения не было.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._state == CLOSED:
+                    return True
+                now = time.monotonic()
+                if self._state == OPEN and now >= self._open_until:
+                    # пробная операция; остальные ждут её результата
+                    self._state = HALF_OPEN
+                    self._trial = True
+                    return True
+                if deadline is not None and now >= deadline:
+                    return False
+                delays = [self._open_until - now] if self._state == OPEN else []
+                if deadline is not None:
+                    delays.append(deadline - now)
+                self._cond.wait(min(delays) if delays else None)
+
+    def record(self, ok: bool) -> None:
+        """Учесть результат операции, разрешённой :meth:`wait`."""
+        with self._cond:
+            now = time.monotonic()
+            trial, self._trial = self._trial, False
+            if ok:
+                if trial or self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._failures.clear()
+                    self._current_cooldown = self.cooldown
+                    self._cond.notify_all()
+                return
+            if trial:
+                self._current_cooldown = min(self._current_cooldown * 2, self.max_cooldown)
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and self._failures[0] < now - self.window:
+                self._failures.popleft()
+            if self._state == CLOSED and len(self._failures) >= self.threshold:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._open_until = now + self._current_cooldown
+        self._failures.clear()
+        self.trips += 1
+        self._cond.notify_all()
+
+
+class Supervisor:
+    """Выполняет операции с сессиями пула, переживая падения браузера.
+
+    Пул уже перезапускает Chrome с тем же профилем, если операция
+    выбросила :class:`WebDriverException`; супервизор повторяет такую
+    операцию до ``retries`` раз с паузой ``backoff * 2 ** попытка``
+    секунд (не больше ``max_backoff``). Все операции проходят через общий
+    :class:`CircuitBreaker`: при всплеске сбоев отправка приостанавливается
+    целиком, а не перебирает попытки по каждому номеру.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[SessionPool] = None,
+        *,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        max_backoff: float = 60.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self._pool = pool
+        if retries is None:
+            retries = int(config.get("WHATSAPP_RETRIES", "3") or 0)
+        if backoff is None:
+            backoff = float(config.get("WHATSAPP_RETRY_BACKOFF", "2") or 0)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker.from_config()
+        self.recovered = 0
+
+    @property
+    def pool(self) -> SessionPool:
+        return self._pool or get_pool()
+
+    def call(self, operation: Callable[[WhatsAppClient], T]) -> T:
+        """Выполнить ``operation`` с сессией пула, повторяя её после сбоя браузера."""
+        attempt = 0
+        while True:
+            self.breaker.wait()
+            try:
+                with self.pool.session() as client:
+                    result = operation(client)
+            except TimeoutException:
+                # браузер ответил, просто не дождались элемента
+                self.breaker.record(True)
+                raise
+            except WebDriverException:
+                self.breaker.record(False)
+                if attempt >= self.retries:
+                    raise
+                time.sleep(min(self.backoff * 2 ** attempt, self.max_backoff))
+                attempt += 1
+                continue
+            except BaseException:
+                self.breaker.record(True)
+                raise
+            self.breaker.record(True)
+            if attempt:
+                self.recovered += 1
+            return result
+
+    def send(self, phone: str, text: str) -> str:
+        """Отправить сообщение, не дублируя его при повторе.
+
+        Браузер мог упасть уже после отправки, поэтому первая попытка,
+        дошедшая до нажатия «Отправить», запоминает последнее исходящее в
+        чате, а перед повтором проверяется, не появилось ли после него
+        исходящее с ``text``. Чат при этом открывается один раз за попытку.
+        """
+        # data-id последнего исходящего до первого нажатия «Отправить»
+        before: List[Optional[str]] = []
+
+        def remember(msg_id: Optional[str]) -> None:
+            if not before:
+                before.append(msg_id)
+
+        def operation(client: WhatsAppClient) -> str:
+            if before and client.was_sent(phone, text, before[0]):
+                return "sent"
+            return client.send_message(phone, text, before_send=remember)
+
+        return self.call(operation)
@@ -1,20 +1,25 @@
-"""Простой диалог опроса в WhatsApp."""
+"""Простой диалог опроса поверх транспорта сообщений."""
 
 from __future__ import annotations
 
+import re
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Callable, List
+from typing import Any, Callable, Dict, List, Optional, Sequence
 
-from .database import get_connection, save_user_survey
-from .whatsapp_sender import send_message, wait_for_reply
-from .zoom import schedule_meeting
+from . import config
+from .campaign import FINISHED, REPLIED, SENT, Campaign
+from .database import get_writer
+from .meeting_pool import get_meeting_pool
+from .messaging import DEFAULT_TIMEOUTS
+from .phones import INVALID_NUMBER
+from .transport import Transport, get_transport
 
-# Вопросы, задаваемые в ходе опроса
-QUESTIONS: List[str] = [
-    "Сколько вам лет?",
-    "Укажите ваше образование",
-    "Укажите ваш пол",
-]
+# Приветствие перед первым вопросом
+WELCOME = (
+    "Здравствуйте! Мы проводим небольшой опрос по выбору участников "
+    "для исследования. Пожалуйста, ответьте на несколько вопросов."
+)
 
 # Настройки квалификации
 AGE_MIN = 25
@@ -22,69 +27,230 @@ AGE_MAX = 35
 REQUIRED_EDUCATION = {"высшее", "higher"}
 ZOOM_LINK = "https://zoom.us/j/123456789"
 
+# Сколько раз переспрашивать, если ответ не удалось разобрать
+MAX_REASKS = 2
 
-def _qualifies(age: int, education: str, gender: str | None = None) -> bool:
-    """Вернуть ``True``, если ответы удовлетворяют критериям."""
 
-    # параметр ``gender`` пока не участвует в логике отбора, но оставлен для
-    # будущих расширений
-    _ = gender  # заглушка для неиспользуемого параметра
-    return AGE_MIN <= age <= AGE_MAX and any(
-        e in education.lower() for e in REQUIRED_EDUCATION
-    )
+class NumberNotOnWhatsApp(RuntimeError):
+    """Отправка показала, что номера нет в WhatsApp: опрос продолжать незачем."""
 
 
-def run_survey(phone: str, name: str, *, get_answer: Callable[[str, str], str | None] | None = None) -> None:
-    """Провести с пользователем простой опрос."""
-    conn = get_connection()
-    answers: List[str] = []
-    if get_answer is None:
-        def get_answer(_phone: str, question: str) -> str:
-            return input(f"{question} ")
-    try:
-        welcome = (
-            "Здравствуйте! Мы проводим небольшой опрос по выбору участников "
-            "для исследования. Пожалуйста, ответьте на несколько вопросов."
-        )
-        send_message(phone, welcome)
-
-        for question in QUESTIONS:
-            send_message(phone, question)
-            answer = get_answer(phone, question)
-            if answer is None:
-                break
-            answers.append(answer)
-
-        save_user_survey(conn, phone, name, "|".join(answers))
+def deliver(send: Callable[[str, str], object], phone: str, text: str) -> None:
+    """Отправить сообщение опроса, прервав опрос на недействующем номере."""
+    if send(phone, text) == INVALID_NUMBER:
+        raise NumberNotOnWhatsApp(f"{phone} is not on WhatsApp")
+
+
+def parse_text(text: str) -> str:
+    """Непустой ответ в нижнем регистре."""
+    value = text.strip().lower()
+    if not value:
+        raise ValueError("Empty answer")
+    return value
+
+
+def parse_age(text: str) -> int:
+    """Возраст из ответа вроде «30» или «мне 30 лет»."""
+    match = re.search(r"\d+", text)
+    if not match or not 0 < int(match.group()) < 120:
+        raise ValueError(f"No age in {text!r}")
+    return int(match.group())
+
+
+@dataclass(frozen=True)
+class Question:
+    """Вопрос опроса: текст, разбор ответа и необязательное правило отбора.
 
+    ``parse`` выбрасывает :class:`ValueError` на неразборчивый ответ, а
+    ``accept`` возвращает ``False`` для значения, с которым участник не
+    подходит.
+    """
+
+    key: str
+    text: str
+    parse: Callable[[str], Any] = parse_text
+    accept: Optional[Callable[[Any], bool]] = None
+    reask: Optional[str] = None
+
+    @property
+    def reask_text(self) -> str:
+        """Текст, с которым вопрос задаётся повторно."""
+        return self.reask or f"Не удалось разобрать ответ. {self.text}"
+
+    def parses(self, text: str) -> bool:
+        """Проверить, что ответ удаётся разобрать."""
         try:
-            age = int(answers[0])
-        except (ValueError, IndexError):
-            age = 0
-        education = answers[1] if len(answers) > 1 else ""
-        gender = answers[2] if len(answers) > 2 else ""
-        if _qualifies(age, education, gender):
+            self.parse(text)
+        except ValueError:
+            return False
+        return True
+
+
+class Survey:
+    """Декларативное описание опроса: вопросы по порядку и правила отбора.
+
+    Правила проверяются после каждого ответа, и опрос заканчивается, как
+    только участник перестал подходить. Прошедшие отбор отвечают на все
+    вопросы: ответы без правил нужны исследованию. Неразборчивый ответ
+    переспрашивается не больше ``max_reasks`` раз (``SURVEY_MAX_REASKS``),
+    после чего опрос завершается.
+    """
+
+    def __init__(self, questions: Sequence[Question], *, max_reasks: Optional[int] = None) -> None:
+        self.questions = list(questions)
+        if max_reasks is None:
+            max_reasks = int(config.get("SURVEY_MAX_REASKS", MAX_REASKS))
+        self.max_reasks = max_reasks
+
+    def values(self, answers: Sequence[str]) -> Dict[str, Any]:
+        """Разобрать полученные ответы по ключам вопросов; неразборчивые — ``None``."""
+        values: Dict[str, Any] = {}
+        for question, answer in zip(self.questions, answers):
             try:
-                link = schedule_meeting({"phone": phone, "name": name})
-            except Exception:
-                link = ZOOM_LINK
-            send_message(phone, f"Вы подходите! Приглашаем на встречу: {link}")
-        else:
-            send_message(phone, "Спасибо за участие! К сожалению, критерии не соответствуют.")
-    finally:
-        conn.close()
+                values[question.key] = question.parse(answer)
+            except ValueError:
+                values[question.key] = None
+        return values
+
+    def verdict(self, answers: Sequence[str]) -> Optional[bool]:
+        """``False`` — не подходит, ``True`` — прошёл все правила, ``None`` — пока неясно."""
+        values = self.values(answers)
+        for question in self.questions:
+            if question.accept is None:
+                continue
+            if question.key not in values:
+                return None
+            value = values[question.key]
+            if value is None or not question.accept(value):
+                return False
+        return True
+
+    def finished(self, answers: Sequence[str]) -> bool:
+        """Получены ответы на все вопросы или участник уже не подходит."""
+        return len(answers) >= len(self.questions) or self.verdict(answers) is False
+
 
+# Опрос по умолчанию; пол пока не участвует в отборе, но сохраняется
+SURVEY = Survey(
+    [
+        Question("age", "Сколько вам лет?", parse_age, lambda age: AGE_MIN <= age <= AGE_MAX,
+                 reask="Пожалуйста, укажите возраст числом, например: 30"),
+        Question("education", "Укажите ваше образование", parse_text,
+                 lambda education: any(e in education for e in REQUIRED_EDUCATION)),
+        Question("gender", "Укажите ваш пол", parse_text),
+    ]
+)
 
-def run_survey_whatsapp(phone: str, name: str) -> None:
-    """Запустить опрос, обмениваясь сообщениями через WhatsApp."""
+# Тексты вопросов опроса по умолчанию
+QUESTIONS: List[str] = [question.text for question in SURVEY.questions]
 
-    def _get_answer(_: str, __: str) -> str | None:
-        return wait_for_reply(phone)
 
-    run_survey(phone, name, get_answer=_get_answer)
+def finish_survey(
+    phone: str,
+    name: str,
+    answers: List[str],
+    *,
+    send: Callable[[str, str], object] | None = None,
+    campaign: Campaign | None = None,
+    started_at: str | None = None,
+    survey: Survey | None = None,
+) -> bool:
+    """Сохранить ответы, проверить критерии и отправить итоговое сообщение.
+
+    Кроме строки в ``users``, значения вопросов ``age``, ``education`` и
+    ``gender`` записываются по полям в ``survey_responses``. По умолчанию
+    сообщение уходит через транспорт процесса. Возвращает ``True``, если
+    участник прошёл отбор.
+    """
+    send = send or get_transport().send
+    survey = survey or SURVEY
+    writer = get_writer()
+    writer.save_user_survey(phone, name, "|".join(answers))
+
+    values = survey.values(answers)
+    qualified = survey.verdict(answers) is True
+    link = None
+    if qualified:
+        try:
+            link = get_meeting_pool().allocate(phone)
+        except Exception:
+            link = ZOOM_LINK
+    writer.save_survey_response(
+        phone,
+        name,
+        age=values.get("age"),
+        education=values.get("education"),
+        gender=values.get("gender"),
+        completed=len(answers) >= len(survey.questions),
+        qualified=qualified,
+        zoom_link=link,
+        campaign_id=campaign.id if campaign else None,
+        started_at=started_at,
+    )
+    if qualified:
+        send(phone, f"Вы подходите! Приглашаем на встречу: {link}")
+        return True
+    send(phone, "Спасибо за участие! К сожалению, критерии не соответствуют.")
+    return False
+
+
+def run_survey(
+    phone: str,
+    name: str,
+    *,
+    transport: Transport | None = None,
+    get_answer: Callable[[str, str], str | None] | None = None,
+    answers: List[str] | None = None,
+    campaign: Campaign | None = None,
+    survey: Survey | None = None,
+    reply_timeout: float = DEFAULT_TIMEOUTS["reply_check"],
+) -> None:
+    """Провести с пользователем опрос ``survey`` (по умолчанию :data:`SURVEY`).
+
+    Вопросы отправляются через ``transport`` (по умолчанию — транспорт
+    процесса), а ответы ожидаются через его ``receive`` не дольше
+    ``reply_timeout`` секунд, если не передан ``get_answer``; молчание
+    завершает опрос. Если переданы уже полученные ``answers``, опрос
+    продолжается со следующего вопроса без повторного приветствия.
+    Прогресс записывается в ``campaign``, если она указана. Если номера
+    нет в WhatsApp, выбрасывается :class:`NumberNotOnWhatsApp`, не
+    дожидаясь ответа.
+    """
+    transport = transport or get_transport()
+    survey = survey or SURVEY
+    started_at = datetime.utcnow().isoformat()
+    answers = list(answers or [])
+    if get_answer is None:
+        def get_answer(_phone: str, _question: str) -> str | None:
+            return transport.receive(phone, timeout=reply_timeout)
+    if not answers:
+        deliver(transport.send, phone, WELCOME)
+
+    while not survey.finished(answers):
+        question = survey.questions[len(answers)]
+        deliver(transport.send, phone, question.text)
+        if campaign:
+            campaign.mark(phone, SENT, answers)
+        answer = get_answer(phone, question.text)
+        reasks = 0
+        while answer is not None and not question.parses(answer) and reasks < survey.max_reasks:
+            reasks += 1
+            deliver(transport.send, phone, question.reask_text)
+            answer = get_answer(phone, question.reask_text)
+        if answer is None or not question.parses(answer):
+            break
+        answers.append(answer)
+        if campaign:
+            campaign.mark(phone, REPLIED, answers)
+
+    finish_survey(
+        phone, name, answers, send=transport.send, campaign=campaign, started_at=started_at, survey=survey
+    )
+    if campaign:
+        campaign.mark(phone, FINISHED, answers)
 
 
 if __name__ == "__main__":
     phone = input("Phone number: ")
     name = input("Name: ")
-    run_survey(phone, name)
+    run_survey(phone, name, get_answer=lambda _phone, question: input(f"{question} "))
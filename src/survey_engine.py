@@ -0,0 +1,222 @@
+"""Событийный движок опроса: много диалогов поверх одной сессии WhatsApp."""
+
+from __future__ import annotations
+
+import heapq
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set
+
+from .campaign import FINISHED, REPLIED, SENT, Campaign
+from .messaging import DEFAULT_TIMEOUTS
+from .metrics import observe
+from .survey import SURVEY, WELCOME, NumberNotOnWhatsApp, Survey, deliver, finish_survey
+from .transport import Transport, get_transport
+
+
+@dataclass
+class Conversation:
+    """Состояние одного опроса: номер текущего вопроса и собранные ответы."""
+
+    phone: str
+    name: str
+    index: int = 0
+    answers: List[str] = field(default_factory=list)
+    # сколько раз текущий вопрос уже переспрошен
+    reasks: int = 0
+    deadline: float = 0.0
+    started_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+
+class SurveyEngine:
+    """Конечный автомат, продвигающий все открытые опросы по мере ответов.
+
+    Новые опросы (:meth:`enqueue`) и ответы (:meth:`submit`) поступают из
+    любого потока, а единственный поток планировщика (:meth:`run`)
+    отправляет следующий вопрос или завершает опрос. Ожидание ответа не
+    занимает ни поток, ни браузер.
+
+    Сообщения уходят через ``transport`` (по умолчанию — транспорт
+    процесса), а его ответы подаются в движок подпиской
+    ``transport.subscribe(lambda m: engine.submit(m.phone, m.text))``.
+    Диалог с номером, которого нет в WhatsApp, завершается неудачей сразу
+    после первой отправки.
+    """
+
+    def __init__(
+        self,
+        send: Optional[Callable[[str, str], object]] = None,
+        *,
+        transport: Optional[Transport] = None,
+        survey: Optional[Survey] = None,
+        reply_timeout: float = DEFAULT_TIMEOUTS["reply_check"],
+        on_finish: Optional[Callable[[Conversation, bool], None]] = None,
+        campaign: Optional[Campaign] = None,
+    ) -> None:
+        self.transport = transport or get_transport()
+        self.send = send or self.transport.send
+        self.campaign = campaign
+        self.survey = survey or SURVEY
+        self.reply_timeout = reply_timeout
+        self.on_finish = on_finish
+        self.conversations: Dict[str, Conversation] = {}
+        self.failed: Set[str] = set()
+        # номера из ``failed``, которых нет в WhatsApp
+        self.invalid: Set[str] = set()
+        # (срок, телефон); записи, срок которых сменился, пропускаются
+        self._deadlines: List[tuple[float, str]] = []
+        self._events: "queue.Queue[tuple[str, str, object] | None]" = queue.Queue()
+        self._stop = threading.Event()
+
+    @property
+    def active(self) -> int:
+        """Количество незавершённых опросов."""
+        return len(self.conversations)
+
+    def enqueue(self, phone: str, name: str, answers: Optional[List[str]] = None) -> None:
+        """Запланировать начало опроса; потокобезопасно."""
+        self._events.put(("start", phone, (name, answers)))
+
+    def start(self, phone: str, name: str, answers: Optional[List[str]] = None) -> Conversation:
+        """Начать опрос: отправить приветствие и первый вопрос.
+
+        Если переданы уже полученные ``answers``, диалог продолжается со
+        следующего вопроса. Вызывается из потока планировщика; из других
+        потоков используйте :meth:`enqueue`.
+        """
+        answers = list(answers or [])
+        conv = Conversation(phone, name, index=len(answers), answers=answers)
+        self.conversations[phone] = conv
+        if self.survey.finished(conv.answers):
+            self._finish(conv)
+            return conv
+        if not answers:
+            deliver(self.send, phone, WELCOME)
+        self._ask(conv)
+        return conv
+
+    def submit(self, phone: str, text: str) -> None:
+        """Передать движку входящее сообщение; потокобезопасно."""
+        self._events.put(("reply", phone, (text, time.monotonic())))
+
+    def stop(self) -> None:
+        """Остановить цикл :meth:`run` после текущего события."""
+        self._stop.set()
+        self._events.put(None)
+
+    def handle_reply(self, phone: str, text: str, received_at: Optional[float] = None) -> None:
+        """Записать ответ и перевести диалог в следующее состояние.
+
+        Неразборчивый ответ переспрашивается, пока не исчерпан лимит
+        повторов; опрос завершается, как только исход отбора ясен.
+        ``received_at`` — момент поступления ответа по ``time.monotonic``.
+        """
+        conv = self.conversations.get(phone)
+        if conv is None:
+            return
+        received_at = time.monotonic() if received_at is None else received_at
+        observe("reply_wait", received_at - (conv.deadline - self.reply_timeout))
+        question = self.survey.questions[conv.index]
+        if not question.parses(text):
+            if conv.reasks < self.survey.max_reasks:
+                conv.reasks += 1
+                self._ask(conv, question.reask_text)
+            else:
+                self._finish(conv)
+            return
+        conv.answers.append(text)
+        conv.index += 1
+        conv.reasks = 0
+        if self.campaign:
+            self.campaign.mark(phone, REPLIED, conv.answers)
+        if self.survey.finished(conv.answers):
+            self._finish(conv)
+        else:
+            self._ask(conv)
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """Завершить опросы, ответ в которых не пришёл вовремя."""
+        now = time.monotonic() if now is None else now
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, phone = heapq.heappop(self._deadlines)
+            conv = self.conversations.get(phone)
+            if conv is not None and conv.deadline == deadline:
+                try:
+                    self._finish(conv)
+                except Exception:
+                    self.failed.add(phone)
+
+    def run(self, *, until_idle: bool = True) -> None:
+        """Обрабатывать входящие ответы и таймауты.
+
+        Перед проверкой сроков обрабатываются все накопившиеся события, а
+        сроки сверяются с моментом, когда очередь оказалась пустой: ответ,
+        пришедший вовремя, не теряется, даже если отправки задержали его
+        обработку. При ``until_idle`` цикл завершается, когда открытых
+        опросов не осталось.
+        """
+        while not self._stop.is_set():
+            if until_idle and not self.conversations and self._events.empty():
+                break
+            if self._deadlines:
+                wait = max(0.0, self._deadlines[0][0] - time.monotonic())
+            else:
+                wait = None
+            try:
+                event = self._events.get(timeout=wait)
+            except queue.Empty:
+                event = None
+            while True:
+                if event is not None:
+                    self._dispatch(*event)
+                # всё, что пришло до этого момента, будет обработано
+                checked = time.monotonic()
+                try:
+                    event = self._events.get_nowait()
+                except queue.Empty:
+                    break
+            self.expire(checked)
+
+    def _dispatch(self, kind: str, phone: str, value) -> None:
+        try:
+            if kind == "start":
+                self.start(phone, *value)
+            else:
+                self.handle_reply(phone, *value)
+        except Exception as exc:
+            # ошибка одного диалога не должна останавливать остальные
+            self.failed.add(phone)
+            if isinstance(exc, NumberNotOnWhatsApp):
+                self.invalid.add(phone)
+            conv = self.conversations.pop(phone, None)
+            if conv is not None and self.on_finish:
+                self.on_finish(conv, False)
+
+    def _ask(self, conv: Conversation, text: Optional[str] = None) -> None:
+        deliver(self.send, conv.phone, text or self.survey.questions[conv.index].text)
+        conv.deadline = time.monotonic() + self.reply_timeout
+        heapq.heappush(self._deadlines, (conv.deadline, conv.phone))
+        if self.campaign:
+            self.campaign.mark(conv.phone, SENT, conv.answers)
+
+    def _finish(self, conv: Conversation) -> None:
+        self.conversations.pop(conv.phone, None)
+        qualified = False
+        try:
+            qualified = finish_survey(
+                conv.phone,
+                conv.name,
+                conv.answers,
+                send=self.send,
+                campaign=self.campaign,
+                started_at=conv.started_at,
+                survey=self.survey,
+            )
+            if self.campaign:
+                self.campaign.mark(conv.phone, FINISHED, conv.answers)
+        finally:
+            if self.on_finish:
+                self.on_finish(conv, qualified)
@@ -0,0 +1,238 @@
+"""Транспорт сообщений, через который опрос общается с респондентами."""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import TYPE_CHECKING, Callable, Deque, Dict, List, Mapping, Optional, Protocol, Tuple, Union
+
+from .database import get_writer
+from .messaging import IncomingMessage
+
+# Selenium загружается только при создании SeleniumTransport, чтобы
+# InMemoryTransport работал без браузера и его зависимостей
+if TYPE_CHECKING:
+    from .session_pool import SessionPool
+    from .supervisor import Supervisor
+    from .watcher import ChatWatcher
+
+Sink = Callable[[IncomingMessage], None]
+# Ответ респондента на сообщение; ``None`` — промолчать
+Responder = Callable[[str, str], Optional[str]]
+
+
+class Transport(Protocol):
+    """Способ доставки сообщений респондентам.
+
+    ``send`` отправляет сообщение и возвращает статус (``"sent"`` или
+    ``"failed"``). Ответы можно ждать по одному номеру через ``receive``
+    или получать все сразу, подписавшись через ``subscribe``.
+    """
+
+    def send(self, phone: str, text: str) -> str: ...
+
+    def receive(self, phone: str, timeout: Optional[float] = None) -> Optional[str]: ...
+
+    def subscribe(self, sink: Sink) -> None: ...
+
+    def close(self) -> None: ...
+
+
+class SeleniumTransport:
+    """Транспорт через WhatsApp Web поверх пула сессий браузера.
+
+    Операции выполняются через :class:`Supervisor`: после падения браузера
+    они повторяются на перезапущенной сессии. Подписка запускает
+    :class:`ChatWatcher`, который опрашивает чаты с непрочитанными
+    сообщениями каждые ``interval`` секунд и приостанавливается вместе с
+    отправкой, когда сбоев становится слишком много.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[SessionPool] = None,
+        *,
+        interval: float = 1.0,
+        supervisor: Optional[Supervisor] = None,
+    ) -> None:
+        from .supervisor import Supervisor
+
+        self._pool = pool
+        self.interval = interval
+        self.supervisor = supervisor or Supervisor(pool)
+        self._watcher: Optional[ChatWatcher] = None
+
+    @property
+    def pool(self) -> SessionPool:
+        from .session_pool import get_pool
+
+        return self._pool or get_pool()
+
+    def send(self, phone: str, text: str) -> str:
+        return self.supervisor.send(phone, text)
+
+    def receive(self, phone: str, timeout: Optional[float] = None) -> Optional[str]:
+        return self.supervisor.call(lambda client: client.wait_for_reply(phone, timeout=timeout))
+
+    def subscribe(self, sink: Sink) -> None:
+        from .watcher import ChatWatcher
+
+        if self._watcher is not None:
+            self._watcher.stop()
+        self._watcher = ChatWatcher(
+            self.pool, interval=self.interval, sink=sink, breaker=self.supervisor.breaker
+        ).start()
+
+    def close(self) -> None:
+        """Остановить наблюдение за чатами и закрыть браузеры."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._pool is not None:
+            self._pool.close()
+        else:
+            from .session_pool import close_pool
+
+            close_pool()
+
+    def __enter__(self) -> SeleniumTransport:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def scripted(answers: Mapping[str, str]) -> Responder:
+    """Респондент, отвечающий на известные сообщения заранее заданным текстом."""
+    return lambda _phone, text: answers.get(text)
+
+
+class InMemoryTransport:
+    """Имитация мессенджера в памяти для нагрузочного тестирования.
+
+    На каждое отправленное сообщение ``responder`` решает, что ответит
+    респондент, а ответ доставляется через ``reply_delay`` секунд (число
+    или диапазон ``(min, max)`` для равномерно случайной задержки). Все
+    отложенные ответы хранятся в одной куче и доставляются одним потоком,
+    поэтому десятки тысяч одновременных респондентов не требуют ни потоков,
+    ни браузеров. Отправленные сообщения пишутся в журнал ``messages``, как
+    и при настоящей отправке.
+    """
+
+    def __init__(
+        self,
+        responder: Responder,
+        *,
+        reply_delay: Union[float, Tuple[float, float]] = 0.0,
+        log: bool = True,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.responder = responder
+        self.reply_delay = reply_delay
+        self.log = log
+        self.sent: Dict[str, List[str]] = defaultdict(list)
+        self._random = random.Random(seed)
+        self._seq = itertools.count()
+        self._pending: List[Tuple[float, int, str, str]] = []
+        self._inbox: Dict[str, Deque[str]] = defaultdict(deque)
+        self._sinks: List[Sink] = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._deliver, daemon=True)
+        self._thread.start()
+
+    def _delay(self) -> float:
+        if isinstance(self.reply_delay, tuple):
+            return self._random.uniform(*self.reply_delay)
+        return self.reply_delay
+
+    def send(self, phone: str, text: str) -> str:
+        if self._closed:
+            return "failed"
+        reply = self.responder(phone, text)
+        with self._cond:
+            self.sent[phone].append(text)
+            if reply is not None:
+                heapq.heappush(self._pending, (time.monotonic() + self._delay(), next(self._seq), phone, reply))
+                self._cond.notify_all()
+        if self.log:
+            get_writer().log_message(phone, text, "sent")
+        return "sent"
+
+    def receive(self, phone: str, timeout: Optional[float] = None) -> Optional[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._inbox[phone]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if self._closed or (remaining is not None and remaining <= 0):
+                    return None
+                self._cond.wait(remaining)
+            return self._inbox[phone].popleft()
+
+    def subscribe(self, sink: Sink) -> None:
+        """Доставлять все последующие ответы в ``sink`` вместо :meth:`receive`."""
+        with self._cond:
+            self._sinks.append(sink)
+
+    def _deliver(self) -> None:
+        while True:
+            with self._cond:
+                while not self._closed and (not self._pending or self._pending[0][0] > time.monotonic()):
+                    timeout = self._pending[0][0] - time.monotonic() if self._pending else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                _, _, phone, text = heapq.heappop(self._pending)
+                sinks = list(self._sinks)
+                if not sinks:
+                    self._inbox[phone].append(text)
+                    self._cond.notify_all()
+            message = IncomingMessage(phone, text, time.time())
+            for sink in sinks:
+                sink(message)
+
+    def close(self) -> None:
+        """Остановить доставку; недоставленные ответы отбрасываются."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self) -> InMemoryTransport:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_TRANSPORT: Optional[Transport] = None
+_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """Вернуть транспорт процесса; по умолчанию — WhatsApp Web."""
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is None:
+            _TRANSPORT = SeleniumTransport()
+        return _TRANSPORT
+
+
+def set_transport(transport: Transport) -> None:
+    """Заменить транспорт процесса, например на :class:`InMemoryTransport`."""
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        _TRANSPORT = transport
+
+
+def close_transport() -> None:
+    """Закрыть транспорт процесса, если он был создан."""
+    global _TRANSPORT
+    with _TRANSPORT_LOCK:
+        if _TRANSPORT is not None:
+            _TRANSPORT.close()
+            _TRANSPORT = None
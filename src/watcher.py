@@ -0,0 +1,96 @@
+"""Фоновое наблюдение за непрочитанными чатами WhatsApp Web."""
+
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from typing import TYPE_CHECKING, Callable, Optional
+
+from selenium.common.exceptions import WebDriverException
+
+from .session_pool import SessionPool, get_pool
+from .messaging import IncomingMessage
+
+if TYPE_CHECKING:
+    from .supervisor import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWatcher:
+    """Поток, собирающий новые входящие сообщения из всех чатов.
+
+    Каждые ``interval`` секунд watcher берёт сессию из пула, вызывает
+    :meth:`WhatsAppClient.fetch_new_messages` и передаёт найденные
+    сообщения в ``sink`` (по умолчанию — в очередь :attr:`events`).
+    Браузер не закрепляется за одним собеседником, как при
+    :meth:`WhatsAppClient.wait_for_reply`. С ``breaker`` опрос чатов
+    приостанавливается, пока выключатель разомкнут, а его сбои учитываются
+    вместе со сбоями отправки.
+    """
+
+    def __init__(
+        self,
+        pool: Optional[SessionPool] = None,
+        *,
+        interval: float = 1.0,
+        sink: Optional[Callable[[IncomingMessage], None]] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self.pool = pool or get_pool()
+        self.breaker = breaker
+        self.interval = interval
+        self.events: "queue.Queue[IncomingMessage]" = queue.Queue()
+        self.sink = sink or self.events.put
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> int:
+        """Выполнить один проход по чатам и вернуть число новых сообщений."""
+        with self.pool.session() as client:
+            messages = client.fetch_new_messages()
+        for message in messages:
+            self.sink(message)
+        return len(messages)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self.breaker and not self.breaker.wait(self.interval):
+                continue
+            ok = True
+            try:
+                self.poll()
+            except WebDriverException:
+                # пул уже перезапустил браузер; пробуем на следующем проходе
+                ok = False
+                logger.warning("Chat poll failed, browser restarted", exc_info=True)
+            except Exception:
+                # браузер ответил, но проход сорвался; поток не должен умереть
+                logger.exception("Chat poll failed")
+            finally:
+                # разрешение выключателя возвращается при любом исходе,
+                # иначе пробная операция оставит его полуразомкнутым
+                if self.breaker:
+                    self.breaker.record(ok)
+            self._stop.wait(self.interval)
+
+    def start(self) -> ChatWatcher:
+        """Запустить наблюдение в фоновом потоке."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Остановить наблюдение и дождаться завершения потока."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> ChatWatcher:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
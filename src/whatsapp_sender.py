@@ -1,25 +1,27 @@
 from __future__ import annotations
+import logging
 import os
+import re
 import time
-from typing import Optional, Dict
+from collections import OrderedDict
+from typing import Callable, Optional, Dict, List
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.common.exceptions import SessionNotCreatedException, TimeoutException, WebDriverException
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
 
-from .database import get_connection, log_message
-
-# --- Константы конфигурации ---
-DEFAULT_TIMEOUTS: Dict[str, int] = {
-    "load_chat": 30,
-    "button_click": 5,
-    "send_check": 10,
-    "reply_check": 60,
-}
+from . import config
+from .chromedriver import driver_path as cached_driver_path, is_stale
+from .cursors import EMPTY_CHAT, ChatCursors, get_cursors
+from .database import get_writer
+from .memory import process_tree_rss
+from .messaging import DEFAULT_TIMEOUTS, IncomingMessage
+from .metrics import observe, timed
+from .phones import normalize_phone, phone_digits
+from .rate_limit import AdaptiveRateLimiter
 
 SELECTORS: Dict[str, list[str] | str] = {
     # Поле ввода сообщения в footer
@@ -35,7 +37,161 @@ SELECTORS: Dict[str, list[str] | str] = {
     "outgoing_msg": "//div[contains(@class,'message-out')]//span[@class='selectable-text']",
     # Входящие сообщения
     "incoming_msg": "//div[contains(@class,'message-in')]//span[@class='selectable-text']",
+    # Поле поиска над списком чатов
+    "search_box": "//div[@id='side']//div[@contenteditable='true']",
+    # Всплывающее окно, например «номер по ссылке недействителен»
+    "dialog": "//div[@role='dialog']",
+    # Чаты в списке слева со значком непрочитанных сообщений
+    "unread_chat": (
+        "//div[@id='pane-side']//div[@role='listitem']"
+        "[.//span[contains(@aria-label,'unread') or contains(@aria-label,'непрочитан')]]"
+    ),
+}
+
+# Входящие сообщения открытого чата после data-id ``arguments[2]``, не
+# больше ``arguments[1]`` последних: [[[data-id, текст], ...], найден ли
+# курсор]. Чат просматривается с конца, поэтому длина истории на стоимость
+# не влияет.
+_JS_READ_INCOMING = """
+const res = document.evaluate(arguments[0], document, null,
+    XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const out = [];
+let found = false;
+for (let i = res.snapshotLength - 1; i >= 0 && out.length < arguments[1]; i--) {
+    const el = res.snapshotItem(i);
+    const row = el.closest('[data-id]');
+    const id = row ? row.getAttribute('data-id') : '';
+    if (arguments[2] && id === arguments[2]) { found = true; break; }
+    out.push([id, el.innerText]);
+}
+return [out.reverse(), found];
+"""
+
+# Прокрутить чат к самому раннему отрисованному сообщению, чтобы WhatsApp
+# подгрузил более раннюю историю; возвращает data-id этого сообщения
+_JS_SCROLL_TO_OLDEST = """
+const first = document.querySelector('#main [data-id]');
+if (!first) return null;
+first.scrollIntoView();
+return first.getAttribute('data-id');
+"""
+
+_JS_OLDEST_ID = "return document.querySelector('#main [data-id]')?.getAttribute('data-id') || null;"
+
+# Последнее исходящее сообщение открытого чата: [data-id, текст, значок галочек]
+_JS_LAST_OUTGOING = """
+const el = document.evaluate('(' + arguments[0] + ')[last()]', document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!el) return null;
+const row = el.closest('[data-id]');
+const icon = row ? row.querySelector('span[data-icon^="msg-"]') : null;
+return [row ? row.getAttribute('data-id') : '', el.innerText,
+        icon ? icon.getAttribute('data-icon') : ''];
+"""
+
+# Строки списка чатов с непрочитанными: [[элемент, число непрочитанных], ...]
+_JS_UNREAD_CHATS = """
+const res = document.evaluate(arguments[0], document, null,
+    XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const out = [];
+for (let i = 0; i < res.snapshotLength; i++) {
+    const row = res.snapshotItem(i);
+    const badge = row.querySelector('span[aria-label]');
+    out.push([row, parseInt(badge ? badge.innerText : '1', 10) || 1]);
 }
+return out;
+"""
+
+# Открыть чат внутри загруженного приложения, кликнув по временной ссылке;
+# возвращает панель чата, открытую до перехода
+_JS_OPEN_LINK = """
+const prev = document.querySelector('#main');
+const link = document.createElement('a');
+link.href = arguments[0];
+link.style.display = 'none';
+document.body.appendChild(link);
+link.click();
+link.remove();
+return prev;
+"""
+
+# Поле ввода, если панель чата сменилась; "dialog", если появилось окно ошибки
+_JS_CHAT_READY = """
+const dialog = document.evaluate(arguments[2], document, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (dialog) return 'dialog';
+const main = document.querySelector('#main');
+if (!main || main === arguments[0]) return null;
+return document.evaluate(arguments[1], main, null,
+    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+"""
+
+# Кто открыт в панели чата: [data-id первого сообщения, заголовок чата]
+_JS_CHAT_IDENTITY = """
+const main = document.querySelector('#main');
+if (!main) return null;
+const row = main.querySelector('[data-id]');
+const title = main.querySelector('header span[title], header span[dir="auto"]');
+return [row ? row.getAttribute('data-id') : '', title ? title.innerText : ''];
+"""
+
+# Флаги экономного режима: без GPU, фоновых служб, звука и автозапуска медиа
+LEAN_FLAGS = (
+    "--disable-gpu",
+    "--disable-software-rasterizer",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication",
+    "--disable-dev-shm-usage",
+    "--mute-audio",
+    "--autoplay-policy=user-gesture-required",
+    "--media-cache-size=1",
+)
+
+# Запросы, которые в экономном режиме не загружаются: медиа и аватары
+# WhatsApp, картинки, видео и шрифты
+LEAN_BLOCKED_URLS = [
+    "*://mmg.whatsapp.net/*",
+    "*://pps.whatsapp.net/*",
+    "*.cdn.whatsapp.net/*",
+    "*.jpg",
+    "*.jpeg",
+    "*.png",
+    "*.gif",
+    "*.webp",
+    "*.mp4",
+    "*.ogg",
+    "*.opus",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+]
+
+# Сколько недавно открытых чатов помнить для перехода через поиск
+_RECENT_CHATS = 50
+
+# Сколько последних входящих сообщений читать из открытого чата за первый
+# проход; если курсора среди них нет, окно удваивается
+_READ_LIMIT = 20
+
+# Сколько раз подгружать более раннюю историю чата в поисках курсора
+_HISTORY_PAGES = 10
+
+logger = logging.getLogger(__name__)
+
+
+class ChatNotFound(TimeoutException):
+    """WhatsApp сообщил, что номер недействителен."""
+
+
+def _phone_from_id(msg_id: str) -> str:
+    """Извлечь номер из ``data-id`` вида ``false_79990001122@c.us_3EB0...``."""
+    match = re.match(r"(?:true|false)_(\d+)@", msg_id)
+    return match.group(1) if match else ""
+
 
 class WhatsAppClient:
     """
@@ -47,56 +203,252 @@ class WhatsAppClient:
         driver_path: Optional[str] = None,
         profile_path: Optional[str] = None,
         headless: bool = False,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+        navigation: Optional[str] = None,
+        lean: Optional[bool] = None,
+        cursors: Optional[ChatCursors] = None,
     ):
+        self.driver_path = driver_path or os.environ.get("CHROMEDRIVER_PATH")
+        self.profile_path = profile_path or os.environ.get("CHROME_PROFILE_DIR")
+        self.headless = headless
+        # экономный режим: без картинок и медиа, с флагами малой памяти
+        if lean is None:
+            lean = str(config.get("WHATSAPP_LEAN", "")).lower() in ("1", "true", "yes", "on")
+        self.lean = lean
+        # data-id последнего обработанного входящего сообщения по номеру;
+        # хранится в базе и общий для всех сессий профиля
+        self.cursors = cursors or get_cursors(self.profile_path or "")
+        # (data-id, значок галочек) последнего подтверждённого исходящего
+        self.last_sent: Optional[tuple[str, str]] = None
+        # темп отправки аккаунта; пул передаёт общий для всех своих сессий
+        self.limiter = limiter or AdaptiveRateLimiter.from_config()
+        # "inapp" — переключать чаты без перезагрузки, "url" — всегда driver.get
+        self.navigation = navigation or config.get("WHATSAPP_NAVIGATION", "inapp")
+        self.base_url = (config.get("WHATSAPP_URL") or "https://web.whatsapp.com").rstrip("/")
+        self.current_chat: Optional[str] = None
+        self.recent_chats: "OrderedDict[str, None]" = OrderedDict()
+        self.driver = self._start_driver()
+
+    def _start_driver(self) -> webdriver.Chrome:
         options = webdriver.ChromeOptions()
-        if headless:
+        if self.headless:
             options.add_argument("--headless")
-        profile = profile_path or os.environ.get("CHROME_PROFILE_DIR")
-        if profile:
-            options.add_argument(f"--user-data-dir={profile}")
-        path = driver_path or os.environ.get("CHROMEDRIVER_PATH")
-        service = Service(executable_path=path) if path else Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=options)
+        if self.profile_path:
+            options.add_argument(f"--user-data-dir={self.profile_path}")
+        if self.lean:
+            for flag in LEAN_FLAGS:
+                options.add_argument(flag)
+            cache_mb = int(config.get("WHATSAPP_DISK_CACHE_MB", "32") or 32)
+            options.add_argument(f"--disk-cache-size={cache_mb * 2 ** 20}")
+            options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        driver = self._launch(options)
+        if self.lean:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
+            except WebDriverException:
+                # без CDP остаётся запрет картинок через настройки профиля
+                pass
+        return driver
+
+    def _launch(self, options: webdriver.ChromeOptions) -> webdriver.Chrome:
+        if self.driver_path:
+            return webdriver.Chrome(service=Service(executable_path=self.driver_path), options=options)
+        path = cached_driver_path()
+        try:
+            return webdriver.Chrome(service=Service(executable_path=path), options=options)
+        except SessionNotCreatedException:
+            # сессия не создаётся и по другим причинам, например когда
+            # профиль уже занят другим Chrome; драйвер меняется, только
+            # если Chrome обновился, а в кеше остался драйвер прежней версии
+            if not is_stale(path):
+                raise
+            return webdriver.Chrome(service=Service(executable_path=cached_driver_path(refresh=True)), options=options)
 
     def __enter__(self) -> WhatsAppClient:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """Закрыть браузер, игнорируя ошибки уже упавшей сессии."""
         if self.driver:
-            self.driver.quit()
+            try:
+                self.driver.quit()
+            except WebDriverException:
+                pass
+            self.driver = None
+
+    def rss(self) -> Optional[int]:
+        """Память ChromeDriver и всех процессов Chrome сессии в байтах.
+
+        ``None``, если браузер не запущен или ``/proc`` недоступен.
+        """
+        service = getattr(self.driver, "service", None)
+        process = getattr(service, "process", None)
+        if process is None:
+            return None
+        return process_tree_rss(process.pid)
+
+    def is_alive(self) -> bool:
+        """Проверить, что браузер отвечает на команды WebDriver."""
+        if not self.driver:
+            return False
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def restart(self) -> None:
+        """Перезапустить Chrome с тем же профилем."""
+        self.close()
+        self.current_chat = None
+        self.recent_chats.clear()
+        self.driver = self._start_driver()
+
+    def open_chat(self, phone_number: str):
+        """Открыть чат и вернуть поле ввода.
+
+        В режиме ``inapp`` чат переключается внутри уже загруженного
+        WhatsApp Web: недавно открытые чаты — через поиск, остальные —
+        через ссылку ``wa.me`` на странице. Полная загрузка страницы
+        выполняется только если приложение ещё не загружено или переход
+        не удался.
+        """
+        digits = phone_digits(phone_number)
+        if self.navigation == "inapp" and self._app_loaded():
+            try:
+                if digits == self.current_chat:
+                    input_box = self.driver.find_elements(By.XPATH, SELECTORS['input_box'])
+                    if input_box:
+                        return input_box[0]
+                if digits in self.recent_chats:
+                    input_box = self._open_via_search(digits)
+                else:
+                    input_box = self._open_via_link(digits)
+                self._remember_chat(digits)
+                return input_box
+            except ChatNotFound:
+                raise
+            except (TimeoutException, WebDriverException):
+                pass
+        return self._open_via_url(phone_number)
+
+    def _app_loaded(self) -> bool:
+        return bool(self.driver.execute_script("return !!document.querySelector('#pane-side')"))
+
+    def _remember_chat(self, digits: str) -> None:
+        self.current_chat = digits
+        self.recent_chats[digits] = None
+        self.recent_chats.move_to_end(digits)
+        while len(self.recent_chats) > _RECENT_CHATS:
+            self.recent_chats.popitem(last=False)
+
+    def _wait_chat_ready(self, previous):
+        result = WebDriverWait(self.driver, DEFAULT_TIMEOUTS['button_click']).until(
+            lambda d: d.execute_script(
+                _JS_CHAT_READY, previous, SELECTORS['input_box'], SELECTORS['dialog']
+            )
+        )
+        if result == "dialog":
+            # закрыть окно, чтобы оно не мешало следующим переходам
+            self.driver.execute_script(
+                "document.evaluate(arguments[0], document, null, 9, null)"
+                ".singleNodeValue?.querySelector('button')?.click()",
+                SELECTORS['dialog'],
+            )
+            raise ChatNotFound("WhatsApp reported the number as invalid")
+        return result
+
+    def _open_via_link(self, digits: str):
+        previous = self.driver.execute_script(_JS_OPEN_LINK, f"https://wa.me/{digits}")
+        return self._wait_chat_ready(previous)
+
+    def _open_via_search(self, digits: str):
+        previous = self.driver.execute_script("return document.querySelector('#main')")
+        search = self.driver.find_element(By.XPATH, SELECTORS['search_box'])
+        search.click()
+        search.send_keys(Keys.CONTROL, "a")
+        search.send_keys(Keys.BACKSPACE)
+        search.send_keys(digits)
+        time.sleep(0.3)  # дать списку отфильтроваться
+        search.send_keys(Keys.ENTER)
+        try:
+            input_box = self._wait_chat_ready(previous)
+            if not self._chat_matches(digits):
+                # первым в выдаче мог оказаться группа, контакт с похожим
+                # именем или сообщение с этим номером
+                raise TimeoutException("Search opened another chat")
+            return input_box
+        finally:
+            # очистить фильтр, иначе список чатов останется отфильтрованным
+            search.send_keys(Keys.ESCAPE)
+
+    def _chat_matches(self, digits: str) -> bool:
+        """Проверить, что в панели открыт чат с номером ``digits``.
+
+        Номер берётся из JID в ``data-id`` сообщений, а в пустом чате — из
+        заголовка; чат с сохранённым именем без сообщений не подтверждается.
+        """
+        identity = self.driver.execute_script(_JS_CHAT_IDENTITY)
+        if not identity:
+            return False
+        msg_id, title = identity
+        if msg_id:
+            return _phone_from_id(msg_id) == digits
+        return phone_digits(title or "") == digits
+
+    def _open_via_url(self, phone_number: str):
+        url = f"{self.base_url}/send?phone={phone_digits(phone_number)}"
+        self.driver.get(url)
+        input_box = WebDriverWait(self.driver, DEFAULT_TIMEOUTS['load_chat']).until(
+            ec.presence_of_element_located((By.XPATH, SELECTORS['input_box']))
+        )
+        self._remember_chat(phone_digits(phone_number))
+        return input_box
 
     def send_message(
         self,
         phone_number: str,
         text: str,
         debug: bool = False,
+        before_send: Optional[Callable[[Optional[str]], None]] = None,
     ) -> str:
         """
         Отправить текстовое сообщение в чат с номером phone_number.
 
+        ``before_send`` вызывается с data-id последнего исходящего в чате
+        (``None`` — исходящих нет) перед нажатием «Отправить».
+
         Вернёт один из статусов:
         - "sent": сообщение успешно появилось в чате.
         - "invalid_number": чат не загрузился или сообщение не появилось.
         - "connection_error": ошибка WebDriver.
         """
         status = "sent"
-        conn = get_connection()
+        dispatched_at: Optional[float] = None
         try:
-            # Открыть чат по номеру
-            url = f"https://web.whatsapp.com/send?phone={phone_number}"
-            self.driver.get(url)
-
-            # Ожидание поля ввода
-            input_box = WebDriverWait(self.driver, DEFAULT_TIMEOUTS['load_chat']).until(
-                ec.presence_of_element_located((By.XPATH, SELECTORS['input_box']))
-            )
-            input_box.click()
-            input_box.clear()
-            input_box.send_keys(text)
+            # Открыть чат по номеру и дождаться поля ввода
+            with timed("chat_load"):
+                input_box = self.open_chat(phone_number)
+            self._ensure_cursor(phone_digits(phone_number))
+            with timed("input"):
+                input_box.click()
+                input_box.clear()
+                input_box.send_keys(text)
             time.sleep(0.5)  # дать время активировать кнопку
 
-            # Предварительный подсчёт исходящих по тексту
-            prev_outgoing = [el.text.strip() for el in self.driver.find_elements(By.XPATH, SELECTORS['outgoing_msg'])]
+            # Последнее исходящее до отправки: новое сообщение должно его сменить
+            before = self._last_outgoing()
+            before_id = before[0] if before else None
+            if before_send:
+                before_send(before_id)
+
+            # Дождаться очереди в планировщике сессии перед отправкой
+            self.limiter.acquire()
+            dispatched_at = time.monotonic()
 
             # Попытка клика по кнопке отправки
             clicked_with: Optional[str] = None
@@ -115,11 +467,16 @@ class WhatsAppClient:
             if not clicked_with:
                 input_box.send_keys(Keys.ENTER)
                 clicked_with = 'ENTER'
+            clicked_at = time.monotonic()
+            observe("send_click", clicked_at - dispatched_at)
 
-            # Проверка по явному содержимому текста
+            # Проверка одним скриптом: новый data-id и ожидаемый текст
             def is_sent() -> bool:
-                msgs = [el.text.strip() for el in self.driver.find_elements(By.XPATH, SELECTORS['outgoing_msg'])]
-                return msgs and msgs[-1] == text
+                last = self._last_outgoing()
+                if not last or last[0] == before_id or last[1].strip() != text.strip():
+                    return False
+                self.last_sent = (last[0], last[2])
+                return True
 
             try:
                 WebDriverWait(self.driver, DEFAULT_TIMEOUTS['send_check']).until(lambda d: is_sent())
@@ -132,6 +489,7 @@ class WhatsAppClient:
 
             if not is_sent():
                 raise TimeoutException("Message not detected after all attempts")
+            observe("send_confirm", time.monotonic() - clicked_at)
 
             if debug:
                 print(f"[DEBUG] Sent via: {clicked_with}")
@@ -147,11 +505,27 @@ class WhatsAppClient:
             status = "connection_error"
             raise
         finally:
-            log_message(conn, phone_number, text, status)
-            conn.close()
+            latency = time.monotonic() - dispatched_at if dispatched_at is not None else None
+            self.limiter.record(status, latency)
+            get_writer().log_message(phone_number, text, status)
 
         return status
 
+    def was_sent(self, phone_number: str, text: str, after: Optional[str]) -> bool:
+        """Проверить, что после исходящего ``after`` в чат ушло ``text``.
+
+        Используется перед повтором отправки после сбоя браузера: сообщение
+        могло уйти до падения. ``after`` — data-id последнего исходящего,
+        переданный в ``before_send`` первой попыткой, поэтому такое же
+        сообщение, отправленное раньше, за новое не принимается.
+        """
+        try:
+            self.open_chat(phone_number)
+        except TimeoutException:
+            return False
+        last = self._last_outgoing()
+        return bool(last) and last[0] != after and last[1].strip() == text.strip()
+
     def wait_for_reply(
         self,
         phone_number: str,
@@ -160,27 +534,153 @@ class WhatsAppClient:
         """
         Открывает чат и ждёт входящее сообщение от phone_number.
         Возвращает текст ответа или None, если время вышло.
+
+        Ответом считается первое сообщение после курсора номера, поэтому
+        ответ, пришедший ещё до вызова, не теряется. Курсор передвигается
+        на возвращённое сообщение: каждый вызов возвращает следующее.
         """
-        conn = None  # нет логирования здесь
+        phone = phone_digits(phone_number)
         try:
-            url = f"https://web.whatsapp.com/send?phone={phone_number}"
-            self.driver.get(url)
-
-            # Подождать поле ввода, чтобы чат загрузился
-            WebDriverWait(self.driver, DEFAULT_TIMEOUTS['load_chat']).until(
-                ec.presence_of_element_located((By.XPATH, SELECTORS['input_box']))
-            )
-            existing = self.driver.find_elements(By.XPATH, SELECTORS['incoming_msg'])
-            start_count = len(existing)
+            # Открыть чат и подождать поле ввода
+            with timed("chat_load"):
+                self.open_chat(phone_number)
+            started = time.monotonic()
+            self._ensure_cursor(phone)
             wait_time = timeout or DEFAULT_TIMEOUTS['reply_check']
 
-            WebDriverWait(self.driver, wait_time).until(
-                lambda d: len(d.find_elements(By.XPATH, SELECTORS['incoming_msg'])) > start_count
-            )
-            messages = self.driver.find_elements(By.XPATH, SELECTORS['incoming_msg'])
-            return messages[-1].text if messages else None
+            def next_reply(d) -> Optional[list[str]]:
+                rows, found = self._read_since(self.cursors.get(phone))
+                if not found:
+                    # какие из сообщений новые, неизвестно: ждём следующих
+                    self._report_gap(phone, len(rows))
+                    if rows:
+                        self.cursors.advance(phone, rows[-1][0])
+                    return None
+                return rows[0] if rows else None
+
+            first = WebDriverWait(self.driver, wait_time).until(next_reply)
+            self.cursors.advance(phone, first[0])
+            observe("reply_wait", time.monotonic() - started)
+            return first[1]
         except TimeoutException:
             return None
-        finally:
-            # Не закрываем driver, он управляется контекстом
-            pass
+
+    def _last_outgoing(self) -> Optional[list[str]]:
+        """Вернуть ``[data-id, текст, значок]`` последнего исходящего за один вызов."""
+        return self.driver.execute_script(_JS_LAST_OUTGOING, SELECTORS['outgoing_msg'])
+
+    def _read_incoming(self, limit: int = _READ_LIMIT, after: Optional[str] = None) -> List[list[str]]:
+        """Вернуть входящие открытого чата после ``after`` (не больше ``limit``)."""
+        result = self.driver.execute_script(_JS_READ_INCOMING, SELECTORS['incoming_msg'], limit, after)
+        return result[0] if result else []
+
+    def _read_since(self, after: Optional[str]) -> tuple[List[list[str]], bool]:
+        """Вернуть все входящие открытого чата после курсора ``after``.
+
+        Окно чтения удваивается, пока курсор не найден, а когда прочитаны
+        все отрисованные сообщения, подгружается более ранняя история.
+        Второй элемент — ``False``, если курсор так и не нашёлся: тогда
+        возвращаются все прочитанные сообщения, и какие из них новые,
+        неизвестно. Без курсора и для пустого чата (:data:`EMPTY_CHAT`)
+        возвращаются все входящие.
+        """
+        if after == EMPTY_CHAT:
+            after = None
+        limit = _READ_LIMIT
+        pages = 0
+        while True:
+            result = self.driver.execute_script(_JS_READ_INCOMING, SELECTORS['incoming_msg'], limit, after)
+            rows, found = result if result else ([], False)
+            if found:
+                return rows, True
+            if len(rows) >= limit:
+                limit *= 2
+                continue
+            if after is None:
+                return rows, True
+            if pages >= _HISTORY_PAGES or not self._load_older():
+                return rows, False
+            pages += 1
+
+    def _load_older(self) -> bool:
+        """Подгрузить более раннюю историю открытого чата; ``False`` — её нет."""
+        oldest = self.driver.execute_script(_JS_SCROLL_TO_OLDEST)
+        if not oldest:
+            return False
+        try:
+            WebDriverWait(self.driver, DEFAULT_TIMEOUTS['button_click']).until(
+                lambda d: d.execute_script(_JS_OLDEST_ID) != oldest
+            )
+        except TimeoutException:
+            return False
+        return True
+
+    @staticmethod
+    def _report_gap(phone: str, skipped: int) -> None:
+        logger.warning(
+            "Cursor for %s is no longer in the chat; %d loaded messages were not treated as new", phone, skipped
+        )
+
+    def _ensure_cursor(self, phone: str) -> None:
+        """Начать курсор нового чата с последнего входящего сообщения.
+
+        История до первого обращения к номеру ответом не считается. Чат
+        без входящих отмечается :data:`EMPTY_CHAT`: в открытом чате значок
+        непрочитанных не появляется, и первый ответ иначе не отличить от
+        переписки, которую бот ещё не видел.
+        """
+        if self.cursors.get(phone) is None:
+            rows = self._read_incoming(1)
+            self.cursors.advance(phone, rows[-1][0] if rows else EMPTY_CHAT)
+
+    def _collect_new(self, phone: str, unread: int) -> List[IncomingMessage]:
+        """Прочитать сообщения открытого чата после курсора и передвинуть его.
+
+        Для чата без курсора, а также если курсор не нашёлся в истории,
+        новыми считаются ``unread`` последних.
+        """
+        seen = self.cursors.get(phone)
+        if seen is None:
+            rows = self._read_incoming(max(unread, 1))
+            fresh = rows[-unread:] if unread else []
+        else:
+            rows, found = self._read_since(seen)
+            fresh = rows if found else (rows[-unread:] if unread else [])
+            if not found:
+                self._report_gap(phone, len(rows) - len(fresh))
+        if rows:
+            self.cursors.advance(phone, rows[-1][0])
+        now = time.time()
+        # номера контактов хранятся в E.164, а в data-id — только цифры
+        sender = normalize_phone(phone) or phone
+        return [IncomingMessage(sender, text, now) for _, text in fresh]
+
+    def fetch_new_messages(self) -> List[IncomingMessage]:
+        """Собрать новые входящие сообщения из всех чатов без перезагрузки страницы.
+
+        Проверяется открытый чат (в нём значок непрочитанных не появляется)
+        и каждый чат со значком непрочитанных в списке слева. Стоимость
+        зависит от числа новых сообщений, а не от числа собеседников.
+        """
+        messages: List[IncomingMessage] = []
+        last = self._read_incoming(1)
+        current = _phone_from_id(last[-1][0]) if last else ""
+        if current and self.cursors.get(current) is not None:
+            messages.extend(self._collect_new(current, 0))
+
+        for chat, unread in self.driver.execute_script(_JS_UNREAD_CHATS, SELECTORS['unread_chat']) or []:
+            previous = last[-1][0] if last else ""
+            chat.click()
+            try:
+                last = WebDriverWait(self.driver, DEFAULT_TIMEOUTS['button_click']).until(
+                    lambda d: (r := self._read_incoming(1)) and r[-1][0] != previous and r
+                )
+            except TimeoutException:
+                continue
+            phone = _phone_from_id(last[-1][0])
+            self.current_chat = None
+            if phone:
+                self._remember_chat(phone)
+                messages.extend(self._collect_new(phone, unread))
+        return messages
+
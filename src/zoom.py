@@ -5,83 +5,212 @@ from __future__ import annotations
 from typing import Any, Mapping
 
 import base64
+import threading
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from . import config
+from .metrics import timed
 
 _API_URL = "https://api.zoom.us/v2"
+_TOKEN_URL = "https://zoom.us/oauth/token"
 
-_TOKEN: str | None = None
-_EXPIRES_AT: float = 0.0
+# За сколько секунд до истечения токен обновляется в фоне
+_REFRESH_MARGIN = 60
+# Токен с меньшим запасом считается истёкшим
+_EXPIRY_SKEW = 30
 
 
 class ZoomAPIError(Exception):
     """Вызывается, когда Zoom API возвращает ошибку."""
 
 
-def get_access_token() -> str:
-    """Вернуть действительный OAuth‑токен, обновляя его при необходимости."""
-    global _TOKEN, _EXPIRES_AT
-
-    now = time.time()
-    if _TOKEN and now < _EXPIRES_AT - 30:
-        return _TOKEN
-
-    client_id = config.get("ZOOM_CLIENT_ID") or config.get("zoom_client_id")
-    client_secret = config.get("ZOOM_CLIENT_SECRET") or config.get("zoom_client_secret")
-    account_id = config.get("ZOOM_ACCOUNT_ID") or config.get("zoom_account_id")
-
-    if not (client_id and client_secret and account_id):
-        raise ZoomAPIError("Zoom OAuth credentials not configured")
-
-    creds = f"{client_id}:{client_secret}".encode()
-    headers = {
-        "Authorization": f"Basic {base64.b64encode(creds).decode()}",
-    }
+class ZoomClient:
+    """Клиент Zoom API с общим пулом HTTP‑соединений.
+
+    Токен обновляется по принципу single-flight: пока один поток получает
+    новый токен, остальные ждут его результата, а не запрашивают свой.
+    Перед истечением токен обновляется заранее фоновым таймером. Ответы
+    ``429`` повторяются с учётом заголовка ``Retry-After``.
+    """
+
+    def __init__(
+        self,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        account_id: str | None = None,
+        *,
+        session: requests.Session | None = None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        api_url: str | None = None,
+        token_url: str | None = None,
+    ) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.account_id = account_id
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.api_url = api_url or config.get("ZOOM_API_URL", _API_URL)
+        self.token_url = token_url or config.get("ZOOM_TOKEN_URL", _TOKEN_URL)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self._token: str | None = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+
+    def _credentials(self) -> tuple[str, str, str]:
+        client_id = self.client_id or config.get("ZOOM_CLIENT_ID")
+        client_secret = self.client_secret or config.get("ZOOM_CLIENT_SECRET")
+        account_id = self.account_id or config.get("ZOOM_ACCOUNT_ID")
+        if not (client_id and client_secret and account_id):
+            raise ZoomAPIError("Zoom OAuth credentials not configured")
+        return client_id, client_secret, account_id
+
+    def _token_valid(self) -> bool:
+        return bool(self._token) and time.time() < self._expires_at - _EXPIRY_SKEW
+
+    def get_access_token(self) -> str:
+        """Вернуть действительный OAuth‑токен, обновляя его при необходимости."""
+        token = self._token
+        if token and self._token_valid():
+            return token
+        with self._lock:
+            # другой поток мог обновить токен, пока мы ждали блокировку
+            if not self._token_valid():
+                self._refresh()
+            return self._token
+
+    def _refresh(self) -> None:
+        """Запросить новый токен; вызывается под ``self._lock``."""
+        client_id, client_secret, account_id = self._credentials()
+        creds = f"{client_id}:{client_secret}".encode()
+        headers = {
+            "Authorization": f"Basic {base64.b64encode(creds).decode()}",
+        }
+        params = {
+            "grant_type": "account_credentials",
+            "account_id": account_id,
+        }
+        now = time.time()
+        with timed("zoom_token"):
+            resp = self._send("POST", self.token_url, headers=headers, params=params)
+        if resp.status_code >= 400:
+            raise ZoomAPIError(f"Token request failed: {resp.text}")
+
+        data = resp.json()
+        token = data.get("access_token")
+        if not token:
+            raise ZoomAPIError("Zoom token missing in response")
+        expires_in = int(data.get("expires_in", 0))
+        self._token = token
+        self._expires_at = now + expires_in
+        self._schedule_refresh(expires_in - _REFRESH_MARGIN)
+
+    def _schedule_refresh(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        if delay <= 0:
+            self._timer = None
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        with self._lock:
+            try:
+                self._refresh()
+            except (ZoomAPIError, requests.RequestException):
+                # следующий запрос обновит токен синхронно
+                pass
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Выполнить запрос, повторяя ответы 429 с учётом ``Retry-After``."""
+        kwargs.setdefault("timeout", 10)
+        for attempt in range(self.max_retries + 1):
+            resp = self.session.request(method, url, **kwargs)
+            if resp.status_code != 429 or attempt == self.max_retries:
+                return resp
+            retry_after = resp.headers.get("Retry-After")
+            try:
+                delay = float(retry_after) if retry_after else self.backoff * 2 ** attempt
+            except ValueError:
+                delay = self.backoff * 2 ** attempt
+            time.sleep(delay)
+        return resp
+
+    def _auth_headers(self, token: str | None = None) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {token or self.get_access_token()}",
+            "Content-Type": "application/json",
+        }
+
+    def create_meeting(self, payload: Mapping[str, Any]) -> str:
+        """Создать встречу в Zoom и вернуть ссылку для подключения."""
+        url = f"{self.api_url}/users/me/meetings"
+        token = self.get_access_token()
+        with timed("zoom_meeting"):
+            response = self._send("POST", url, headers=self._auth_headers(token), json=payload)
+        if response.status_code == 401:
+            # токен отозван раньше срока — обновить один раз и повторить;
+            # если его уже обновил другой поток с тем же 401, взять новый
+            with self._lock:
+                if self._token == token:
+                    self._refresh()
+                token = self._token
+            response = self._send("POST", url, headers=self._auth_headers(token), json=payload)
+        if response.status_code >= 400:
+            raise ZoomAPIError(f"Zoom API error: {response.text}")
+        data = response.json()
+        return data.get("join_url", "")
+
+    def schedule_meeting(self, user_info: Mapping[str, Any]) -> str:
+        """Запланировать встречу для пользователя и вернуть ссылку."""
+        payload = {
+            "topic": f"Interview with {user_info.get('name', '')}",
+            "type": 1,  # мгновенная встреча
+        }
+        return self.create_meeting(payload)
+
+    def close(self) -> None:
+        """Остановить фоновое обновление и закрыть соединения."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.session.close()
+
+
+_CLIENT: ZoomClient | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> ZoomClient:
+    """Вернуть общий клиент Zoom процесса."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = ZoomClient()
+        return _CLIENT
 
-    params = {
-        "grant_type": "account_credentials",
-        "account_id": account_id,
-    }
 
-    url = "https://zoom.us/oauth/token"
-    resp = requests.post(url, headers=headers, params=params, timeout=10)
-    if resp.status_code >= 400:
-        raise ZoomAPIError(f"Token request failed: {resp.text}")
-
-    data = resp.json()
-    _TOKEN = data.get("access_token")
-    expires_in = int(data.get("expires_in", 0))
-    _EXPIRES_AT = now + expires_in
-    if not _TOKEN:
-        raise ZoomAPIError("Zoom token missing in response")
-
-    return _TOKEN
-
-def _auth_headers() -> dict[str, str]:
-    token = get_access_token()
-    return {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
+def get_access_token() -> str:
+    """Вернуть действительный OAuth‑токен, обновляя его при необходимости."""
+    return get_client().get_access_token()
 
 
 def create_meeting(payload: Mapping[str, Any]) -> str:
     """Создать встречу в Zoom и вернуть ссылку для подключения."""
-    url = f"{_API_URL}/users/me/meetings"
-    response = requests.post(url, headers=_auth_headers(), json=payload, timeout=10)
-    if response.status_code >= 400:
-        raise ZoomAPIError(f"Zoom API error: {response.text}")
-    data = response.json()
-    return data.get("join_url", "")
+    return get_client().create_meeting(payload)
 
 
 def schedule_meeting(user_info: Mapping[str, Any]) -> str:
     """Запланировать встречу для пользователя и вернуть ссылку."""
-    payload = {
-        "topic": f"Interview with {user_info.get('name', '')}",
-        "type": 1,  # мгновенная встреча
-    }
-    return create_meeting(payload)
+    return get_client().schedule_meeting(user_info)